@@ -3,14 +3,32 @@ const uri = process.env.MONGODB_URI;
 
 const PlayerStatlines = mongoose.model('PlayerStatlines', new mongoose.Schema({}, { strict: false }), 'player_statlines');
 
+// Game logs are stored column by column; the table wants one row per game:
+// [date, team, "Home"/"Away", minutes, ...stats]. Older documents already hold rows.
+function toRows(gameLog) {
+    if (!gameLog || Array.isArray(gameLog)) return gameLog || [];
+    return gameLog.date.map((date, i) => {
+        const [year, month, day] = date ? date.split('-').map(Number) : [];
+        const minutes = gameLog.minutes[i];
+        return [
+            date ? `${month}/${day}/${year}` : '',
+            gameLog.team[i],
+            gameLog.home[i] ? 'Home' : 'Away',
+            minutes === null ? '' : String(minutes),
+            ...gameLog.categories.map(stat => gameLog.stats[stat][i]),
+        ];
+    });
+}
+
 export default async function getPlayerStatlines(req, res) {
     if (req.method === 'GET') {
         const player = req.query.player.replace('_', ' '); // Use query parameters for player name
 
         try {
             await mongoose.connect(uri, { useNewUrlParser: true, useUnifiedTopology: true });
-            const gameLog = await PlayerStatlines.findOne({ player }).lean();
-            res.status(200).json(gameLog ? gameLog.game_log : []);
+            // Indexed on (player, date); only the game log goes over the wire
+            const gameLog = await PlayerStatlines.findOne({ player }, { game_log: 1, _id: 0 }).sort({ date: -1 }).lean();
+            res.status(200).json(gameLog ? toRows(gameLog.game_log) : []);
         } catch (err) {
             console.error(err);
             res.status(500).json({ message: err.message });
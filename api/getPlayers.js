@@ -2,13 +2,16 @@ const mongoose = require("mongoose");
 const uri = process.env.MONGODB_URI;
 
 const FinalTable = mongoose.model('FinalTable', new mongoose.Schema({}, { strict: false }), 'final_table');
+// One pre-built document per slate, written by code/nba.py after final_table
+const Slate = mongoose.model('Slate', new mongoose.Schema({}, { strict: false }), 'slates');
 
 export default async function getPlayers(req, res) {
     if (req.method === 'GET') {
         try {
             await mongoose.connect(uri, { useNewUrlParser: true, useUnifiedTopology: true });
-            const players = await FinalTable.find().lean();
-            console.log("DB:", players)
+            // Latest slate via the date index; final_table is only read until the first slate is published
+            const slate = await Slate.findOne({}, { players: 1, _id: 0 }).sort({ date: -1 }).lean();
+            const players = slate ? slate.players : await FinalTable.find({}, { _id: 0, _hash: 0 }).lean();
             res.status(200).json(players);
         } catch (err) {
             console.error(err);
@@ -0,0 +1,275 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+import nba
+
+# Parser configurations to compare: (label, HTML_PARSER, TARGETED_PARSING)
+PARSER_CONFIGS = [
+    ("html.parser, full tree", "html.parser", False),
+    ("lxml, full tree", "lxml", False),
+    ("lxml, targeted", "lxml", True),
+]
+
+# Trimmed pages saved from the real sites; anything missing is built synthetically
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+FIRST_NAMES = ['Aaron', 'Bam', 'Cade', 'Darius', 'Evan', 'Franz', 'Gary', 'Hakim', 'Immanuel', 'Jalen',
+               'Keegan', 'Luka', 'Malik', 'Nikola', 'Obi', 'Paolo', 'Quentin', 'Royce', 'Scottie', 'Tyrese',
+               'Usman', 'Victor', 'Walker', 'Xavier', 'Zion']
+LAST_NAMES = ['Adams', 'Brown', 'Carter', 'Davis', 'Edwards', 'Fox', 'Green', 'Harris', 'Ivey', 'Jackson',
+              'Kessler', 'Lopez', 'Murray', 'Nance', 'Okoro', 'Porter', 'Quickley', 'Reaves', 'Smith', 'Thompson']
+STATMUSE_HEADERS = ['', 'NAME', '', 'DATE', 'TM', '', 'OPP', 'MIN', 'PTS', 'REB', 'AST', 'STL', 'BLK', '3PM']
+
+def page(body, padding=400):
+    # Real pages carry a lot of navigation, ads and scripts around the data
+    noise = "".join(
+        f'<div class="nav__item"><a href="/link/{i}">Link {i}</a><span>filler text {i}</span></div>'
+        for i in range(padding)
+    )
+    return f"<html><head><script>var x = 1;</script></head><body>{noise}{body}{noise}</body></html>".encode()
+
+def slate_teams(game):
+    # Real team nicknames so the slate joins against the defense rankings;
+    # slates bigger than 15 games reuse teams
+    visit = nba.NBA_TEAMS[(2 * game) % len(nba.NBA_TEAMS)][2]
+    home = nba.NBA_TEAMS[(2 * game + 1) % len(nba.NBA_TEAMS)][2]
+    return visit, home
+
+def slate_player(game, side, slot):
+    return f"{FIRST_NAMES[(game + slot) % len(FIRST_NAMES)]} {LAST_NAMES[game % len(LAST_NAMES)]}{side.title()}{slot}"
+
+def build_lineups_page(games, players_per_side=5, bench_per_side=3):
+    positions = ['PG', 'SG', 'SF', 'PF', 'C']
+    blocks = []
+
+    for game in range(games):
+        visit, home = slate_teams(game)
+        sides = []
+        for side in ['visit', 'home']:
+            items = ['<li class="lineup__status is-confirmed">Confirmed Lineup</li>']
+            for slot in range(players_per_side):
+                name = slate_player(game, side, slot)
+                items.append(
+                    f'<li class="lineup__player is-pct-play-100"><div class="lineup__pos">{positions[slot % 5]}</div>'
+                    f'<a title="{name}" href="/player/{game}{side}{slot}">{name[:10]}</a></li>'
+                )
+            items.append('<li class="lineup__title is-middle">MAY NOT PLAY</li>')
+            for slot in range(bench_per_side):
+                items.append(
+                    f'<li class="lineup__player is-pct-play-50"><div class="lineup__pos">G</div>'
+                    f'<a title="Bench {game}-{side}-{slot}">Bench</a></li>'
+                )
+            sides.append(f'<ul class="lineup__list is-{side}">{"".join(items)}</ul>')
+
+        blocks.append(
+            '<div class="lineup is-nba"><div class="lineup__box"><div class="lineup__top">'
+            '<div class="lineup__meta"><div class="lineup__time">7:00 PM ET</div></div>'
+            f'<div class="lineup__teams"><a class="lineup__mteam is-visit white">{visit} (10-5)</a>'
+            f'<a class="lineup__mteam is-home white">{home} (8-7)</a></div></div>'
+            f'<div class="lineup__main">{"".join(sides)}</div></div></div>'
+        )
+
+    return page("".join(blocks))
+
+def build_injuries_page(teams=30, players_per_team=4):
+    sections = []
+    for team in range(teams):
+        rows = "".join(
+            f"<tr><td>Injured {team}-{i}</td><td>G</td><td>Jan 1</td><td>Out</td><td>Knee soreness, day-to-day</td></tr>"
+            for i in range(players_per_team)
+        )
+        sections.append(
+            '<div class="ResponsiveTable Table__league-injuries"><div class="Table__Title">'
+            f'<span class="injuries__teamName">Team {team}</span></div>'
+            '<table><thead><tr><th>NAME</th><th>POS</th><th>EST. RETURN DATE</th><th>STATUS</th><th>COMMENT</th></tr></thead>'
+            f'<tbody>{rows}</tbody></table></div>'
+        )
+    return page("".join(sections))
+
+def build_fantasypros_page(position):
+    header = "".join(f"<th>{h}</th>" for h in ['Team'] + nba.CATEGORIES)
+    rows = []
+    for i, (abbr, city, nickname) in enumerate(nba.NBA_TEAMS):
+        values = [f"{(i * 7 + len(position) * 3 + j * 11) % 30 + 10}.{j}" for j in range(len(nba.CATEGORIES))]
+        rows.append(f"<tr><td>{abbr} {city} {nickname}</td>" + "".join(f"<td>{v}</td>" for v in values) + "</tr>")
+    return page(f"<table><thead><tr>{header}</tr></thead><tbody>{''.join(rows)}</tbody></table>")
+
+def build_season_averages_page(player):
+    first, last = player.split(' ', 1)
+    cells = [f"{player} {first[0]}. {last}", '72', '25.1', '7.3', '8.0', '1.2', '0.6', '2.2']
+    header = "".join(f"<th>{h}</th>" for h in ['NAME', 'GP', 'PPG', 'RPG', 'APG', 'SPG', 'BPG', '3PM'])
+    return page(f"<table><tr>{header}</tr><tr>{''.join(f'<td>{c}</td>' for c in cells)}</tr></table>")
+
+def build_statmuse_page(games=8):
+    header = "".join(f"<th>{h}</th>" for h in STATMUSE_HEADERS)
+    rows = []
+    for i in range(games):
+        cells = ['1', 'Some Player', '', f'1/{i + 1}/2024', 'LAL', 'vs' if i % 2 else '@', 'BOS', '34',
+                 str(20 + i), '7', '6', '1', '0', '2']
+        rows.append("<tr>" + "".join(f"<td>{c}</td>" for c in cells) + "</tr>")
+    if games > 1:
+        # Average and total summary rows
+        for label in ['Average', 'Total']:
+            cells = ['', label, '', '', '', '', '', '34', '23', '7', '6', '1', '0', '2']
+            rows.append("<tr>" + "".join(f"<td>{c}</td>" for c in cells) + "</tr>")
+    return page(f"<table><thead><tr>{header}</tr></thead><tbody>{''.join(rows)}</tbody></table>")
+
+def load_fixture(fixtures_dir, name, build):
+    # A saved page from fixtures_dir if there is one, otherwise a synthetic one
+    path = os.path.join(fixtures_dir, name) if fixtures_dir else None
+    if path and os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+    return build()
+
+def measure(func, args, repeat):
+    tracemalloc.start()
+    result = func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    return result, elapsed, peak
+
+def bench_parsers(fixtures_dir=None, repeat=5):
+    cases = [
+        ("lineups", nba.parse_nba_lineups, (load_fixture(fixtures_dir, "lineups.html", lambda: build_lineups_page(10)),)),
+        ("injuries", nba.parse_injury_report, (load_fixture(fixtures_dir, "injuries.html", build_injuries_page),)),
+        ("statmuse vs team", nba.parse_statmuse_player_vs_team,
+         (load_fixture(fixtures_dir, "statmuse_vs_team.html", build_statmuse_page), nba.CATEGORIES)),
+    ]
+    saved = (nba.HTML_PARSER, nba.TARGETED_PARSING)
+
+    try:
+        for name, func, args in cases:
+            print(f"\n{name} ({len(args[0]) / 1024:.0f} KB page)")
+            baseline = None
+            for label, parser, targeted in PARSER_CONFIGS:
+                nba.HTML_PARSER, nba.TARGETED_PARSING = parser, targeted
+                result, elapsed, peak = measure(func, args, repeat)
+                if baseline is None:
+                    baseline = (result, elapsed)
+                elif result != baseline[0]:
+                    raise AssertionError(f"{label} parsed {name} differently from {PARSER_CONFIGS[0][0]}")
+                print(f"  {label:<24} {elapsed * 1000:8.2f} ms  peak {peak / 1024:8.0f} KB  x{baseline[1] / elapsed:.1f}")
+    finally:
+        nba.HTML_PARSER, nba.TARGETED_PARSING = saved
+
+def scan_injury_report(injury_report, player):
+    # The per-player DataFrame scan the final-table loop used to do
+    injury_info = injury_report[injury_report['player'] == player]
+    return injury_info.iloc[0]['status_comment'] if not injury_info.empty else ''
+
+def bench_injury_lookup(players=500, injured=150):
+    names = [f"{first} {last}" for last in LAST_NAMES for first in FIRST_NAMES][:players]
+    # ESPN drops the suffix for some players that statmuse keeps
+    slate = [f"{name} Jr." if i % 7 == 0 else name for i, name in enumerate(names)]
+    injury_report = pd.DataFrame({
+        'player': [names[i * 3 % players] for i in range(injured)],
+        'status_comment': [f"Out ({i})" for i in range(injured)],
+    })
+
+    start = time.perf_counter()
+    scanned = [scan_injury_report(injury_report, player) for player in slate]
+    scan_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    injury_index = nba.InjuryIndex(injury_report)
+    indexed = [injury_index.lookup(player) for player in slate]
+    index_time = time.perf_counter() - start
+
+    print(f"\ninjury lookup ({players} players, {injured} injured)")
+    print(f"  {'DataFrame scan':<24} {scan_time * 1000:8.2f} ms  {sum(map(bool, scanned))} matched")
+    print(f"  {'InjuryIndex':<24} {index_time * 1000:8.2f} ms  {sum(map(bool, indexed))} matched  x{scan_time / index_time:.1f}")
+
+def build_replay_cache(path, games, fixtures_dir=None):
+    # Every page the pipeline asks for, stored under its real URL so the
+    # scrapers run unchanged in offline mode
+    cache = nba.HttpCache(path, max_bytes=10 ** 10)
+    lineups_page = load_fixture(fixtures_dir, "lineups.html", lambda: build_lineups_page(games))
+    cache.put(nba.ROTOWIRE_LINEUPS_URL, lineups_page)
+    cache.put(nba.ESPN_INJURIES_URL, load_fixture(fixtures_dir, "injuries.html", build_injuries_page))
+    for position in nba.FANTASYPROS_POSITIONS:
+        cache.put(f"{nba.FANTASYPROS_DVP_URL}&pos={position}",
+                  load_fixture(fixtures_dir, f"fantasypros_{position}.html", lambda: build_fantasypros_page(position)))
+
+    statmuse_page = load_fixture(fixtures_dir, "statmuse_vs_team.html", build_statmuse_page)
+    for game in nba.parse_nba_lineups(lineups_page):
+        for lineup, opponent in [(game['away_lineup'], game['home_team']), (game['home_lineup'], game['away_team'])]:
+            for _, player, _ in lineup:
+                cache.put(nba.format_statmuse_url(player, opponent), statmuse_page)
+                cache.put(nba.format_season_averages_url(player),
+                          load_fixture(fixtures_dir, "statmuse_season.html", lambda: build_season_averages_page(player)))
+    cache.close()
+
+def bench_slate(games, fixtures_dir=None, repeat=3):
+    workdir = tempfile.mkdtemp(prefix="nba-bench-")
+    saved = (nba.CACHE_ENABLED, nba.OFFLINE, nba.CACHE_PATH)
+    try:
+        path = os.path.join(workdir, "replay.sqlite")
+        build_replay_cache(path, games, fixtures_dir)
+        nba.configure_cache(offline=True, path=path)
+
+        lineups = nba.scrape_nba_lineups()
+        positional_dfs = nba.scrape_fantasypros_defense_vs_position()
+        player_map = nba.build_player_defense_map(lineups, nba.build_rank_table(
+            {position: df.copy() for position, df in positional_dfs.items()}, nba.CATEGORIES), nba.CATEGORIES)
+        player_history = nba.get_player_statistics(player_map)
+        injury_index = nba.InjuryIndex(nba.get_injury_report())
+
+        def vs_team():
+            return [nba.get_statmuse_player_vs_team(info['player'], info['opposing_team'], nba.CATEGORIES)
+                    for info in player_map]
+
+        def positional_ranks():
+            return nba.get_positional_ranks({position: df.copy() for position, df in positional_dfs.items()},
+                                            lineups, nba.CATEGORIES)
+
+        # (stage, function, items processed per call)
+        stages = [
+            ("lineups", nba.scrape_nba_lineups, len(lineups)),
+            ("positional ranks", positional_ranks, len(lineups)),
+            ("statmuse vs team", vs_team, len(player_map)),
+            ("injury report", nba.get_injury_report, 1),
+            ("final table", lambda: nba.build_final_table(player_history, nba.CATEGORIES, injury_index, 'bench'),
+             len(player_history)),
+        ]
+
+        print(f"\n{'recorded' if games is None else 'synthetic'} slate: {len(lineups)} games, {len(player_map)} players")
+        for name, func, items in stages:
+            _, elapsed, peak = measure(func, (), repeat)
+            print(f"  {name:<24} {elapsed * 1000:8.2f} ms  {items / elapsed:10.0f} items/s  peak {peak / 1024:8.0f} KB")
+    finally:
+        nba.configure_cache(enabled=saved[0], offline=saved[1], path=saved[2])
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the nba.py scrapers.")
+    parser.add_argument('--fixtures', default=FIXTURES_DIR,
+                        help="directory of saved pages (lineups.html, injuries.html, statmuse_vs_team.html, "
+                             "statmuse_season.html, fantasypros_<POS>.html)")
+    parser.add_argument('--synthetic', action='store_true', help="ignore the fixtures and use synthetic pages only")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--suite', choices=['all', 'parsers', 'injuries', 'slates'], default='all')
+    parser.add_argument('--games', type=int, nargs='+', default=[5, 15, 30], help="synthetic slate sizes")
+    args = parser.parse_args()
+    if args.synthetic:
+        args.fixtures = None
+
+    if args.suite in ('all', 'parsers'):
+        bench_parsers(args.fixtures, args.repeat)
+    if args.suite in ('all', 'injuries'):
+        bench_injury_lookup()
+    if args.suite in ('all', 'slates'):
+        # The recorded slate first, then synthetic pages scaled to each --games size
+        if args.fixtures and os.path.exists(os.path.join(args.fixtures, "lineups.html")):
+            bench_slate(None, args.fixtures, args.repeat)
+        for games in args.games:
+            bench_slate(games, None, args.repeat)
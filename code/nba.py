@@ -1,64 +1,733 @@
-import requests
-from bs4 import BeautifulSoup
-from datetime import datetime
-import pandas as pd
+from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import argparse
+import cProfile
+import difflib
+import functools
+import hashlib
+import importlib
+import io
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+import tracemalloc
+import unicodedata
 import os
-import requests
-from pymongo import MongoClient
-from pymongo.server_api import ServerApi
+
+class LazyModule:
+    # Stands in for a heavy dependency and imports it on first attribute
+    # access, so commands that never scrape, parse or write start quickly
+    # (check with `python -X importtime code/nba.py --help`)
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+bs4 = LazyModule('bs4')
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+pymongo = LazyModule('pymongo')
+requests = LazyModule('requests')
 # from dotenv import load_dotenv
 # load_dotenv()
 
-def scrape_nba_lineups():
-    url = "https://www.rotowire.com/basketball/nba-lineups.php"
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+ROTOWIRE_LINEUPS_URL = "https://www.rotowire.com/basketball/nba-lineups.php"
+ESPN_INJURIES_URL = 'https://www.espn.com/nba/injuries'
+FANTASYPROS_DVP_URL = "https://www.fantasypros.com/nba/defense-vs-position.php?range=30"
+FANTASYPROS_POSITIONS = ["PG", "SG", "SF", "PF", "C"]
+# Stat categories ranked, averaged and published for every player
+CATEGORIES = ['PTS', 'REB', 'AST', '3PM', 'STL', 'BLK']
+
+# Fetch engine settings: one pooled keep-alive session shared by every scraper,
+# with a cap on in-flight requests per host so we don't get throttled
+REQUEST_TIMEOUT = float(os.getenv("NBA_REQUEST_TIMEOUT", 15))
+MAX_WORKERS = int(os.getenv("NBA_MAX_WORKERS", 16))
+# Players in flight at once when streaming statmuse results downstream
+STREAM_WINDOW = int(os.getenv("NBA_STREAM_WINDOW", 2 * MAX_WORKERS))
+# Players per vectorized final-table chunk in the streaming pipeline
+FINAL_TABLE_CHUNK = int(os.getenv("NBA_FINAL_TABLE_CHUNK", 25))
+DEFAULT_HOST_CONCURRENCY = 4
+HOST_CONCURRENCY = {
+    'www.statmuse.com': int(os.getenv("NBA_STATMUSE_CONCURRENCY", 8)),
+    'www.fantasypros.com': 5,  # one per position
+}
+
+_session = None
+_session_lock = threading.Lock()
+_host_semaphores = {}
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=MAX_WORKERS)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+def get_host_semaphore(host):
+    with _session_lock:
+        if host not in _host_semaphores:
+            limit = HOST_CONCURRENCY.get(host, DEFAULT_HOST_CONCURRENCY)
+            _host_semaphores[host] = threading.BoundedSemaphore(limit)
+        return _host_semaphores[host]
+
+# Rate limiting and retry settings: each host gets a token bucket that slows
+# down when the source pushes back, plus a circuit breaker for dead sources
+DEFAULT_HOST_RATE = 5.0  # requests per second
+HOST_RATES = {
+    'www.statmuse.com': float(os.getenv("NBA_STATMUSE_RATE", 4)),
+}
+MIN_HOST_RATE = 0.25
+MAX_RETRIES = int(os.getenv("NBA_MAX_RETRIES", 4))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+CIRCUIT_FAILURE_THRESHOLD = 10
+CIRCUIT_COOLDOWN = 60.0
+
+_host_limiters = {}
+
+# HTTP cache settings: pages are kept in a local SQLite file keyed by URL and
+# served without hitting the network until their source's TTL runs out
+CACHE_PATH = os.getenv("NBA_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "http_cache.sqlite"))
+CACHE_MAX_BYTES = int(os.getenv("NBA_CACHE_MAX_BYTES", 200 * 1024 * 1024))
+DEFAULT_CACHE_TTL = 60 * 60
+# Longest matching URL prefix wins
+CACHE_TTLS = {
+    'https://www.rotowire.com/': 10 * 60,  # lineups change up to tipoff
+    'https://www.espn.com/': 30 * 60,
+    'https://www.fantasypros.com/': 24 * 60 * 60,  # 30-day defense vs position ranges
+    'https://www.statmuse.com/nba/ask?q=': 6 * 60 * 60,  # season averages
+    'https://www.statmuse.com/nba/ask/': 24 * 60 * 60,  # vs team, last 2 years
+}
+# Statmuse answers cut off before a past date don't change anymore
+HISTORICAL_CACHE_TTL = 30 * 24 * 60 * 60
+
+CACHE_ENABLED = True
+OFFLINE = False
+_cache = None
+
+# Run report settings: stage timings, per-request stats and counters for each
+# run are written here as JSON when the run ends
+RUN_REPORT_PATH = os.getenv("NBA_RUN_REPORT", os.path.join(os.path.dirname(CACHE_PATH), "run_report.json"))
+
+# HTML parsing settings: lxml is much faster than html.parser, and strainers
+# let each scraper build only the subtrees it actually reads
+HTML_PARSER = os.getenv("NBA_HTML_PARSER", "lxml")
+TARGETED_PARSING = os.getenv("NBA_TARGETED_PARSING", "1") != "0"
+
+LINEUPS_STRAINER = ('div', 'lineup is-nba')
+INJURIES_STRAINER = ('div', 'ResponsiveTable Table__league-injuries')
+TABLE_STRAINER = ('table', None)
+
+# MongoDB write settings: documents are buffered and sent in unordered batches
+MONGO_BATCH_SIZE = int(os.getenv("NBA_MONGO_BATCH_SIZE", 500))
+MONGO_WRITE_CONCERN = os.getenv("NBA_MONGO_WRITE_CONCERN", "majority")
+MONGO_WTIMEOUT_MS = int(os.getenv("NBA_MONGO_WTIMEOUT_MS", 30000))
+MONGO_RETRY_WRITES = os.getenv("NBA_MONGO_RETRY_WRITES", "1") != "0"
+MONGO_WRITE_RETRIES = int(os.getenv("NBA_MONGO_WRITE_RETRIES", 3))
+# 'swap' rebuilds each collection in a staging copy and renames it over the
+# live one; 'upsert' rewrites only documents whose content changed
+WRITE_MODES = ['swap', 'upsert']
+DEFAULT_WRITE_MODE = os.getenv("NBA_WRITE_MODE", "swap")
+DOCUMENT_KEY = ('date', 'player', 'opposing_team')
+# A run that produces less than this share of the documents it should have
+# (or of what's live) keeps the live data instead, unless allow_empty is set
+MIN_PUBLISH_FRACTION = float(os.getenv("NBA_MIN_PUBLISH_FRACTION", 0.5))
+
+# Indexes behind every API lookup, created on each collection we write. Swapped
+# collections get them on staging, so they're already built when the rename lands.
+PLAYER_DOCUMENT_INDEXES = [
+    # Not unique: a player listed twice in the lineups shouldn't fail the whole publish
+    ([(field, 1) for field in DOCUMENT_KEY], {}),
+    ([('player', 1), ('date', -1)], {}),
+    ([('opposing_team', 1)], {}),
+]
+COLLECTION_INDEXES = {
+    'final_table': PLAYER_DOCUMENT_INDEXES,
+    'player_statlines': PLAYER_DOCUMENT_INDEXES,
+    'final_table_history': PLAYER_DOCUMENT_INDEXES,
+    'player_statlines_history': PLAYER_DOCUMENT_INDEXES,
+    'matchups': [([('date', 1)], {'unique': True})],
+    'slates': [([('date', 1)], {'unique': True})],
+}
+
+# Backfill settings: one worker process per date at a time, writing into
+# date-keyed history collections next to the live ones
+BACKFILL_PROCESSES = int(os.getenv("NBA_BACKFILL_PROCESSES", 4))
+HISTORY_COLLECTIONS = {'final_table': 'final_table_history', 'player_statlines': 'player_statlines_history'}
+INJURY_REPORT_COLUMNS = ['team', 'player', 'position', 'est_return_date', 'status_comment']
+
+# Watch mode settings: how often lineups and injuries are polled before tipoff
+WATCH_INTERVAL = int(os.getenv("NBA_WATCH_INTERVAL", 5 * 60))
+WATCHED_URLS = ['https://www.rotowire.com/', 'https://www.espn.com/']
+
+class CachedResponse:
+    def __init__(self, url, status_code, content, headers=None, from_cache=False):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+class HttpCache:
+    def __init__(self, path, max_bytes=CACHE_MAX_BYTES):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                content BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT content, etag, last_modified, fetched_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self.conn.commit()
+
+        content, etag, last_modified, fetched_at = row
+        return {'content': content, 'etag': etag, 'last_modified': last_modified, 'fetched_at': fetched_at}
+
+    def put(self, url, content, etag=None, last_modified=None):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, content, etag, last_modified, now, now, len(content))
+            )
+            self.evict()
+            self.conn.commit()
+
+    def touch(self, url):
+        # A 304 means our copy is still good, so restart its TTL
+        with self.lock:
+            self.conn.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self.conn.commit()
+
+    def delete(self, url):
+        with self.lock:
+            self.conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self.conn.commit()
+
+    def evict(self):
+        # Drop least recently used pages until the store fits in max_bytes
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, size in self.conn.execute("SELECT url, size FROM responses ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            total -= size
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def configure_cache(enabled=True, offline=False, path=None):
+    global CACHE_ENABLED, OFFLINE, CACHE_PATH, _cache
+    # Offline replay only makes sense with the cache turned on
+    CACHE_ENABLED = enabled or offline
+    OFFLINE = offline
+    if path:
+        CACHE_PATH = path
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+
+def get_cache():
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    with _session_lock:
+        if _cache is None:
+            _cache = HttpCache(CACHE_PATH)
+        return _cache
+
+def get_cache_ttl(url):
+    if '-before-' in url or '+before+' in url:
+        return HISTORICAL_CACHE_TTL
+    matches = [prefix for prefix in CACHE_TTLS if url.startswith(prefix)]
+    if not matches:
+        return DEFAULT_CACHE_TTL
+    return CACHE_TTLS[max(matches, key=len)]
+
+class RunStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = datetime.now()
+            self.started = time.perf_counter()
+            self.started_cpu = time.process_time()
+            self.stages = []
+            self.sources = {}
+            self.requests = []
+            self.writes = {}
+            self.counters = {}
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    def source(self, host):
+        if host not in self.sources:
+            self.sources[host] = {'requests': 0, 'cache_hits': 0, 'errors': 0, 'bytes': 0, 'fetch_time': 0.0,
+                                  'parses': 0, 'parse_time': 0.0}
+        return self.sources[host]
+
+    @contextmanager
+    def stage(self, name):
+        start, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            stage = {'name': name, 'wall': time.perf_counter() - start, 'cpu': time.process_time() - start_cpu}
+            with self.lock:
+                self.stages.append(stage)
+            print(f"Stage {name}: {stage['wall']:.2f}s wall, {stage['cpu']:.2f}s cpu")
+
+    def record_request(self, url, response, wall):
+        host = urlparse(url).netloc
+        status = response.status_code if response is not None else None
+        size = len(response.content) if response is not None else 0
+        from_cache = bool(response is not None and response.from_cache)
+        with self.lock:
+            source = self.source(host)
+            source['cache_hits' if from_cache else 'requests'] += 1
+            source['errors'] += status is None or status >= 400
+            source['bytes'] += size
+            source['fetch_time'] += wall
+            self.requests.append({'url': url, 'status': status, 'wall': wall, 'bytes': size, 'cached': from_cache})
+
+    def record_parse(self, host, wall):
+        with self.lock:
+            source = self.source(host)
+            source['parses'] += 1
+            source['parse_time'] += wall
+
+    def record_writes(self, name, documents, batches, wall):
+        with self.lock:
+            self.writes[name] = {'documents': documents, 'batches': batches, 'write_time': wall}
+
+    def count(self, name, value):
+        with self.lock:
+            self.counters[name] = value
+
+    def report(self):
+        limiter_metrics = fetch_metrics()
+        # Stages overlap under run_dag and tracemalloc's peak is process-wide,
+        # so it's only meaningful for the run as a whole
+        peak_memory = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+        with self.lock:
+            sources = {host: dict(source, **limiter_metrics.get(host, {})) for host, source in self.sources.items()}
+            return {
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'finished_at': datetime.now().isoformat(timespec='seconds'),
+                'wall': time.perf_counter() - self.started,
+                'cpu': time.process_time() - self.started_cpu,
+                'peak_memory': peak_memory,
+                'stages': list(self.stages),
+                'sources': sources,
+                'writes': dict(self.writes),
+                'counters': dict(self.counters),
+                'requests': list(self.requests),
+            }
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        print(f"Run report written to {path}")
+
+run_stats = RunStats()
+
+def timed_parse(host):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                run_stats.record_parse(host, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+class Task:
+    # One stage of a run. func gets the results of its deps as keyword
+    # arguments. An optional task that still fails after its retries hands
+    # `fallback` to its dependents instead of stopping the run.
+    def __init__(self, name, func, deps=(), retries=0, optional=False, fallback=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.retries = retries
+        self.optional = optional
+        self.fallback = fallback
+
+def run_task(task, results):
+    with run_stats.stage(task.name):
+        return task.func(**{dep: results[dep] for dep in task.deps})
+
+def run_dag(tasks, max_workers=4):
+    # Starts every task as soon as its deps are done, so independent scrapers
+    # overlap and the run takes as long as its slowest chain
+    tasks = {task.name: task for task in tasks}
+    for task in tasks.values():
+        missing = [dep for dep in task.deps if dep not in tasks]
+        if missing:
+            raise ValueError(f"Task {task.name} depends on unknown tasks {missing}")
+
+    results, timings, attempts = {}, {}, {}
+    started = time.perf_counter()
+    running = {}
+    error = None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def submit(task):
+            attempts[task.name] = attempts.get(task.name, 0) + 1
+            timings.setdefault(task.name, [time.perf_counter() - started, None])
+            running[executor.submit(run_task, task, results)] = task
+
+        pending = dict(tasks)
+        while pending or running:
+            if error is None:
+                for task in [task for task in pending.values() if all(dep in results for dep in task.deps)]:
+                    del pending[task.name]
+                    submit(task)
+            elif not running:
+                break
+            if not running:
+                raise ValueError(f"Tasks {sorted(pending)} can never run: their deps form a cycle")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                try:
+                    results[task.name] = future.result()
+                except Exception as e:
+                    # Only the failed task reruns; finished ones keep their results
+                    if attempts[task.name] <= task.retries:
+                        print(f"Task {task.name} failed ({e}), retrying")
+                        submit(task)
+                        continue
+                    if not task.optional:
+                        print(f"Task {task.name} failed: {e}")
+                        error = error or e
+                        continue
+                    print(f"Task {task.name} failed, continuing without it: {e}")
+                    results[task.name] = task.fallback
+                timings[task.name][1] = time.perf_counter() - started
+
+    report_critical_path(tasks, timings)
+    if error is not None:
+        raise error
+    return results
+
+def report_critical_path(tasks, timings):
+    finished = {name: timing for name, timing in timings.items() if timing[1] is not None}
+    if not finished:
+        return
+    # Walk back from the last task to finish through whichever dep held it up longest
+    name = max(finished, key=lambda name: finished[name][1])
+    path = []
+    while name:
+        path.append(name)
+        deps = [dep for dep in tasks[name].deps if dep in finished]
+        name = max(deps, key=lambda dep: finished[dep][1]) if deps else None
+    path.reverse()
+
+    run_stats.count('critical_path', [
+        {'task': name, 'start': finished[name][0], 'end': finished[name][1]} for name in path
+    ])
+    steps = " -> ".join(f"{name} ({finished[name][1] - finished[name][0]:.2f}s)" for name in path)
+    print(f"Critical path: {steps}, {finished[path[-1]][1]:.2f}s in total")
+
+class CircuitOpenError(OSError):
+    pass
+
+class HostLimiter:
+    def __init__(self, host, rate):
+        self.host = host
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.open_until = 0.0
+        self.probe_until = 0.0
+        self.consecutive_failures = 0
+        self.lock = threading.Lock()
+        self.metrics = {'requests': 0, 'cache_hits': 0, 'retries': 0, 'throttled': 0, 'failures': 0,
+                        'circuit_opens': 0, 'throttled_time': 0.0}
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.open_until:
+                    raise CircuitOpenError(f"Circuit open for {self.host} after {self.consecutive_failures} failures")
+
+                # Half open: after the cooldown a single probe goes out and
+                # everyone else waits to hear how it went
+                half_open = self.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD
+                if half_open and now < self.probe_until:
+                    wait = min(0.1, self.probe_until - now)
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    wait = self.paused_until - now
+                    if wait <= 0 and self.tokens >= 1:
+                        self.tokens -= 1
+                        self.metrics['requests'] += 1
+                        if half_open:
+                            # The lease runs out if the probe never reports back
+                            self.probe_until = now + REQUEST_TIMEOUT + 1
+                        return
+                    if wait <= 0:
+                        wait = (1 - self.tokens) / self.rate
+                    self.metrics['throttled_time'] += wait
+            time.sleep(wait)
+
+    def count(self, metric):
+        with self.lock:
+            self.metrics[metric] += 1
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.probe_until = 0.0
+            # Additive increase back towards the configured rate
+            self.rate = min(self.max_rate, self.rate + 0.1 * self.max_rate)
+
+    def record_throttle(self, retry_after):
+        # Throttling means the source is up and wants us slower, so it only
+        # shrinks the bucket; it never counts towards the circuit breaker
+        with self.lock:
+            # Multiplicative decrease, and everyone waits out Retry-After
+            self.metrics['throttled'] += 1
+            self.rate = max(MIN_HOST_RATE, self.rate / 2)
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            # A throttled probe hasn't told us anything, so let the next one go
+            self.probe_until = 0.0
+
+    def record_failure(self):
+        # Connection errors, timeouts and 5xx responses
+        with self.lock:
+            self.metrics['failures'] += 1
+            self.consecutive_failures += 1
+            self.probe_until = 0.0
+            # Once open, a failed probe after the cooldown reopens it; only a
+            # success closes it again
+            if self.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD:
+                if time.monotonic() >= self.open_until:
+                    self.metrics['circuit_opens'] += 1
+                    print(f"Circuit open for {self.host}, pausing requests for {CIRCUIT_COOLDOWN:.0f}s")
+                self.open_until = time.monotonic() + CIRCUIT_COOLDOWN
+
+def get_host_limiter(host):
+    with _session_lock:
+        if host not in _host_limiters:
+            _host_limiters[host] = HostLimiter(host, HOST_RATES.get(host, DEFAULT_HOST_RATE))
+        return _host_limiters[host]
+
+def backoff_delay(attempt):
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def fetch_metrics():
+    with _session_lock:
+        limiters = list(_host_limiters.values())
+    metrics = {}
+    for limiter in limiters:
+        with limiter.lock:
+            metrics[limiter.host] = dict(limiter.metrics)
+    return metrics
+
+def print_fetch_metrics():
+    for host, metrics in fetch_metrics().items():
+        print(f"{host}: {metrics['requests']} requests, {metrics['cache_hits']} cache hits, "
+              f"{metrics['retries']} retries, {metrics['throttled']} throttled, {metrics['failures']} failures, "
+              f"{metrics['throttled_time']:.1f}s waiting on the rate limit")
+
+def fetch(url, headers=None, timeout=None):
+    start = time.perf_counter()
+    response = None
+    try:
+        response = request_page(url, headers, timeout)
+        return response
+    finally:
+        run_stats.record_request(url, response, time.perf_counter() - start)
+
+def request_page(url, headers=None, timeout=None):
+    cache = get_cache()
+    entry = cache.get(url) if cache else None
+    limiter = get_host_limiter(urlparse(url).netloc)
+
+    if entry and (OFFLINE or time.time() - entry['fetched_at'] < get_cache_ttl(url)):
+        limiter.count('cache_hits')
+        return CachedResponse(url, 200, entry['content'], from_cache=True)
+    if OFFLINE:
+        # Same answer as an HTTP only-if-cached miss
+        print(f"Offline: no cached copy of {url}")
+        return CachedResponse(url, 504, b'')
+
+    # Revalidate a stale copy instead of downloading it again
+    request_headers = dict(headers or {})
+    if entry and entry['etag']:
+        request_headers['If-None-Match'] = entry['etag']
+    if entry and entry['last_modified']:
+        request_headers['If-Modified-Since'] = entry['last_modified']
+
+    session = get_session()
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire()
+        try:
+            with get_host_semaphore(limiter.host):
+                response = session.get(url, headers=request_headers, timeout=timeout or REQUEST_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout):
+            limiter.record_failure()
+            if attempt == MAX_RETRIES:
+                raise
+            limiter.count('retries')
+            time.sleep(backoff_delay(attempt))
+            continue
+
+        if response.status_code not in RETRY_STATUSES:
+            limiter.record_success()
+            break
+
+        retry_after = None
+        if response.status_code == 429:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            limiter.record_throttle(retry_after)
+        else:
+            limiter.record_failure()
+        if attempt == MAX_RETRIES:
+            # Fail loudly rather than hand an error page to the parsers
+            response.raise_for_status()
+        limiter.count('retries')
+        # A Retry-After pause is enforced by the limiter on the next acquire
+        if not retry_after:
+            time.sleep(backoff_delay(attempt))
+
+    if entry and response.status_code == 304:
+        cache.touch(url)
+        return CachedResponse(url, 200, entry['content'], from_cache=True)
+
+    if cache and response.status_code == 200:
+        cache.put(url, response.content, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+    return CachedResponse(url, response.status_code, response.content, response.headers)
+
+@functools.lru_cache(maxsize=None)
+def get_strainer(tag, class_=None):
+    return bs4.SoupStrainer(tag, class_=class_) if class_ else bs4.SoupStrainer(tag)
+
+def make_soup(content, parse_only=None):
+    # parse_only is a (tag, class) pair like TABLE_STRAINER
+    strainer = get_strainer(*parse_only) if parse_only and TARGETED_PARSING else None
+    return bs4.BeautifulSoup(content, HTML_PARSER, parse_only=strainer)
+
+def read_table_cells(table):
+    # One walk over the table picks up both header and data cells
+    headers, values = [], []
+    for cell in table.find_all(['th', 'td']):
+        if cell.name == 'th':
+            headers.append(cell.get_text().strip())
+        else:
+            values.append(cell.get_text().strip())
+    return headers, values
+
+def parse_lineup_section(lineup_section, team_name):
+    lineup = []
+    for item in lineup_section.find_all('li'):
+        classes = item.get('class', [])
+        if 'is-middle' in classes:
+            break
+        if 'lineup__player' in classes:
+            position = item.find('div', class_='lineup__pos').text.strip()
+
+            player_tag = item.find('a')
+            name = player_tag.get("title", player_tag.text).strip()
+
+            lineup.append((position, name, team_name))
+    return lineup
+
+@timed_parse('www.rotowire.com')
+def parse_nba_lineups(content):
+    soup = make_soup(content, LINEUPS_STRAINER)
 
     matchups = soup.find_all('div', class_='lineup is-nba')
     games = []
 
     for matchup in matchups:
-        if matchup.find('a', class_='lineup__mteam is-visit white') is None:
-            continue
-
-        time = matchup.find('div', class_='lineup__time').text
-        
         # Find away and home teams
         away_team = matchup.find('a', class_='lineup__mteam is-visit white')
+        if away_team is None:
+            continue
         home_team = matchup.find('a', class_='lineup__mteam is-home white')
 
-        away_team_name = away_team.text.split('(')[0].strip() if away_team else 'Unknown'
+        time = matchup.find('div', class_='lineup__time').text
+
+        away_team_name = away_team.text.split('(')[0].strip()
         home_team_name = home_team.text.split('(')[0].strip() if home_team else 'Unknown'
-        
-        away_lineup, home_lineup = [], []
-
-        # Find away team players
-        away_lineup_section = matchup.find_next('ul', class_='lineup__list is-visit')
-        if away_lineup_section:
-            for item in away_lineup_section.find_all('li'):
-                if 'is-middle' in item.get('class', []):
-                    break
-                if 'lineup__player' in item.get('class', []):
-                    position = item.find('div', class_='lineup__pos').text.strip()
-                    
-                    player_tag = item.find('a')
-                    name = player_tag.get("title", player_tag.text).strip()
-
-                    away_lineup.append((position, name, away_team_name))
-
-        # Find home team players
-        home_lineup_section = matchup.find_next('ul', class_='lineup__list is-home')
-        if home_lineup_section:
-            for item in home_lineup_section.find_all('li'):
-                if 'is-middle' in item.get('class', []):
-                    break
-                if 'lineup__player' in item.get('class', []):
-                    position = item.find('div', class_='lineup__pos').text.strip()
-
-                    player_tag = item.find('a')
-                    name = player_tag.get("title", player_tag.text).strip()
-
-                    home_lineup.append((position, name, home_team_name))
+
+        # Both lineup lists live inside the matchup block, so search it
+        # rather than scanning forward through the rest of the page
+        away_lineup_section = matchup.find('ul', class_='lineup__list is-visit')
+        away_lineup = parse_lineup_section(away_lineup_section, away_team_name) if away_lineup_section else []
+
+        home_lineup_section = matchup.find('ul', class_='lineup__list is-home')
+        home_lineup = parse_lineup_section(home_lineup_section, home_team_name) if home_lineup_section else []
 
         games.append({
             "time": time,
@@ -70,21 +739,78 @@ def scrape_nba_lineups():
         
     return games
 
-def scrape_fantasypros_defense_vs_position():
-    fp_url = "https://www.fantasypros.com/nba/defense-vs-position.php?range=30"
-    positions = ["PG", "SG", "SF", "PF", "C"]
+def format_lineups_url(date=None):
+    return f"{ROTOWIRE_LINEUPS_URL}?date={date}" if date else ROTOWIRE_LINEUPS_URL
+
+def scrape_nba_lineups(date=None):
+    response = fetch(format_lineups_url(date))
+    return parse_nba_lineups(response.content)
 
-    all_position_data = {}
+@timed_parse('www.fantasypros.com')
+def parse_fantasypros_table(html):
+    # read_html builds the lxml tree once and hands back every table in page
+    # order, so there's no soup to re-serialize and parse a second time
+    return pd.read_html(io.StringIO(html), flavor="lxml")[0]
 
-    for pos in positions:
-        url = f"{fp_url}&pos={pos}"
-        html = requests.get(url).text
-        soup = BeautifulSoup(html, "html.parser")
-        table = soup.find("table")
-        df = pd.read_html(str(table), flavor="lxml")[0]
-        all_position_data[pos] = df
+def get_fantasypros_position(pos):
+    html = fetch(f"{FANTASYPROS_DVP_URL}&pos={pos}").text
+    return parse_fantasypros_table(html)
 
-    return all_position_data
+def scrape_fantasypros_defense_vs_position():
+    # All five positions at once over the shared session
+    with ThreadPoolExecutor(max_workers=len(FANTASYPROS_POSITIONS)) as executor:
+        position_data = list(executor.map(get_fantasypros_position, FANTASYPROS_POSITIONS))
+
+    return dict(zip(FANTASYPROS_POSITIONS, position_data))
+
+# (abbreviation, city, nickname) for every team. Rotowire, FantasyPros and
+# statmuse each spell teams differently, so everything is matched through this.
+NBA_TEAMS = [
+    ('ATL', 'Atlanta', 'Hawks'), ('BOS', 'Boston', 'Celtics'), ('BKN', 'Brooklyn', 'Nets'),
+    ('CHA', 'Charlotte', 'Hornets'), ('CHI', 'Chicago', 'Bulls'), ('CLE', 'Cleveland', 'Cavaliers'),
+    ('DAL', 'Dallas', 'Mavericks'), ('DEN', 'Denver', 'Nuggets'), ('DET', 'Detroit', 'Pistons'),
+    ('GSW', 'Golden State', 'Warriors'), ('HOU', 'Houston', 'Rockets'), ('IND', 'Indiana', 'Pacers'),
+    ('LAC', 'Los Angeles', 'Clippers'), ('LAL', 'Los Angeles', 'Lakers'), ('MEM', 'Memphis', 'Grizzlies'),
+    ('MIA', 'Miami', 'Heat'), ('MIL', 'Milwaukee', 'Bucks'), ('MIN', 'Minnesota', 'Timberwolves'),
+    ('NOP', 'New Orleans', 'Pelicans'), ('NYK', 'New York', 'Knicks'), ('OKC', 'Oklahoma City', 'Thunder'),
+    ('ORL', 'Orlando', 'Magic'), ('PHI', 'Philadelphia', '76ers'), ('PHX', 'Phoenix', 'Suns'),
+    ('POR', 'Portland', 'Trail Blazers'), ('SAC', 'Sacramento', 'Kings'), ('SAS', 'San Antonio', 'Spurs'),
+    ('TOR', 'Toronto', 'Raptors'), ('UTA', 'Utah', 'Jazz'), ('WAS', 'Washington', 'Wizards'),
+]
+TEAM_ALIASES = {
+    'BKN': ['BRK'], 'CHA': ['CHO'], 'GSW': ['GS'], 'LAC': ['LA Clippers'], 'NOP': ['NO', 'NOR'],
+    'NYK': ['NY'], 'PHI': ['Sixers'], 'PHX': ['PHO'], 'POR': ['Blazers'], 'SAS': ['SA'],
+    'UTA': ['UTAH'], 'WAS': ['WSH'],
+}
+
+def build_team_lookup():
+    lookup = {}
+    for abbr, city, nickname in NBA_TEAMS:
+        names = [abbr, nickname, f"{city} {nickname}"] + TEAM_ALIASES.get(abbr, [])
+        # Los Angeles alone doesn't say which team
+        if city != 'Los Angeles':
+            names.append(city)
+        for name in names:
+            lookup[name.lower()] = abbr
+    return lookup
+
+TEAM_LOOKUP = build_team_lookup()
+# Longest names first, so 'los angeles lakers' wins over a bare 'lakers'
+TEAM_NAME_PATTERNS = [
+    (re.compile(r'\b' + re.escape(name) + r'\b'), abbr)
+    for name, abbr in sorted(TEAM_LOOKUP.items(), key=lambda item: -len(item[0]))
+]
+_canonical_teams = {}
+
+def canonical_team(name):
+    if name not in _canonical_teams:
+        key = " ".join(str(name).lower().split())
+        abbr = TEAM_LOOKUP.get(key)
+        if abbr is None:
+            # Labels like 'BOS Boston Celtics' or 'Celtics (20-5)'
+            abbr = next((abbr for pattern, abbr in TEAM_NAME_PATTERNS if pattern.search(key)), None)
+        _canonical_teams[name] = abbr
+    return _canonical_teams[name]
 
 def create_ranks(df_dvp, rank_columns):    
     for column in rank_columns:
@@ -92,51 +818,75 @@ def create_ranks(df_dvp, rank_columns):
         df_dvp[column + '_rank'] = df_dvp[column].rank(method='min', ascending=True)
     return df_dvp
 
+def build_rank_table(positional_dfs, rank_columns):
+    # One (team, position) -> ranks table for every position, keyed by the
+    # canonical team abbreviation so lookups are exact joins
+    frames = []
+    for position, df in positional_dfs.items():
+        columns = [column for column in rank_columns if column in df.columns]
+        df = create_ranks(df, columns)
+        ranks = df[[column + '_rank' for column in columns]].set_axis(columns, axis=1)
+        ranks.index = pd.MultiIndex.from_arrays(
+            [df['Team'].astype(str).map(canonical_team), [position] * len(df)],
+            names=['team', 'position']
+        )
+        frames.append(ranks)
+
+    if not frames:
+        return pd.DataFrame(columns=rank_columns, index=pd.MultiIndex.from_tuples([], names=['team', 'position']))
+
+    rank_table = pd.concat(frames).reindex(columns=rank_columns)
+    rank_table = rank_table[rank_table.index.get_level_values('team').notna()]
+    rank_table = rank_table[~rank_table.index.duplicated()]
+    return rank_table.astype('Int64')
+
+def rank_values(ranks):
+    return {column: None if pd.isna(value) else int(value) for column, value in ranks.items()}
+
 def get_positional_ranks(positional_dfs, lineups, rank_columns):
     team_ranks = []
-
-    # First, add ranking columns to each positional DataFrame
-    for position, df in positional_dfs.items():
-        positional_dfs[position] = create_ranks(df, rank_columns)
+    rank_table = build_rank_table(positional_dfs, rank_columns)
+    ranks_by_key = rank_table.to_dict('index')
+    missing = {column: None for column in rank_columns}
 
     for game in lineups:
         game_ranks = {}
 
-        # Extract both the home and away team lineups
-        teams = {
-            "home_team": game['home_team'],
-            "away_team": game['away_team'],
-            "home_lineup": game['home_lineup'],
-            "away_lineup": game['away_lineup']
-        }
-
-        for team_key in ['home_team', 'away_team']:
-            team_name = teams[team_key]
-            team_data = {}
-
-            # Iterate over each position (PG, SG, SF, PF, C)
-            for position, df in positional_dfs.items():
-                # Check if the team name is in the 'Team' column (using contains for partial matches)
-                team_row = df[df['Team'].str.contains(team_name, case=False, na=False)]
-
-                if not team_row.empty:
-                    pos_ranks = {}
-                    
-                    for column in rank_columns:
-                        # Ensure we're referencing the rank column
-                        pos_ranks[column] = int(team_row[column + '_rank'].values[0])
-
-                    team_data[position] = pos_ranks
-                else:
-                    # If team not found for a specific position, set None for all columns
-                    team_data[position] = {column: None for column in rank_columns}
-
-            game_ranks[team_name] = team_data
+        for team_name in [game['home_team'], game['away_team']]:
+            team = canonical_team(team_name)
+            game_ranks[team_name] = {
+                position: rank_values(ranks_by_key.get((team, position), missing))
+                for position in positional_dfs
+            }
 
         team_ranks.append(game_ranks)
 
     return team_ranks
 
+def build_player_defense_map(lineups, rank_table, categories):
+    players = []
+    for game in lineups:
+        for pos, player, team in game['home_lineup']:
+            players.append({'player': player, 'position': pos, 'player_team': team, 'opposing_team': game['away_team']})
+        for pos, player, team in game['away_lineup']:
+            players.append({'player': player, 'position': pos, 'player_team': team, 'opposing_team': game['home_team']})
+
+    if rank_table is None or not players:
+        for player_info in players:
+            player_info['defense_stats'] = {cat: None for cat in categories}
+        return players
+
+    # Join every starter to their opponent's ranks at their position in one go
+    keys = pd.MultiIndex.from_arrays(
+        [[canonical_team(info['opposing_team']) for info in players], [info['position'] for info in players]],
+        names=['team', 'position']
+    )
+    ranks = rank_table.reindex(index=keys, columns=categories)
+    for player_info, (_, player_ranks) in zip(players, ranks.iterrows()):
+        player_info['defense_stats'] = rank_values(player_ranks)
+
+    return players
+
 def filter_ranks(team_rankings):
     all_ranks = []
 
@@ -180,103 +930,278 @@ def map_players_to_defense_rankings(lineups, filtered_ranks):
 
     return player_defense_mapping
 
-def format_statmuse_url(player, opp_team):
-    player_formatted = "-".join(player.lower().split())
-    return f"https://www.statmuse.com/nba/ask/{player_formatted}-vs-{opp_team}-last-2-years-including-playoffs"
+def normalize_player_name(player):
+    return "-".join(player.lower().split())
+
+def format_as_of(as_of):
+    # "2024-01-15" -> "january-15-2024", the way statmuse phrases dates
+    date = datetime.strptime(as_of, '%Y-%m-%d')
+    return f"{date.strftime('%B').lower()}-{date.day}-{date.year}"
+
+def format_statmuse_url(player, opp_team, as_of=None):
+    player_formatted = normalize_player_name(player)
+    url = f"https://www.statmuse.com/nba/ask/{player_formatted}-vs-{opp_team}-last-2-years-including-playoffs"
+    # Backfills only look at games played before the slate
+    return f"{url}-before-{format_as_of(as_of)}" if as_of else url
+
+class GameLog:
+    # A player's game log stored column by column: parsed dates, numeric
+    # minutes and one float32 row of stats per game, instead of a list of
+    # mixed strings and floats per game
+    __slots__ = ('categories', 'dates', 'teams', 'home', 'opponents', 'minutes', 'stats')
+
+    def __init__(self, categories, dates, teams, home, opponents, minutes, stats):
+        self.categories = tuple(categories)
+        self.dates = dates
+        self.teams = teams
+        self.home = home
+        self.opponents = opponents
+        self.minutes = minutes
+        self.stats = stats
+
+    @classmethod
+    def from_columns(cls, categories, dates, teams, home, opponents, minutes, stats):
+        # Dates and minutes as statmuse prints them ("1/15/2024", "35"), stats as floats
+        categories = tuple(categories)
+        return cls(
+            categories,
+            pd.to_datetime(dates, format='%m/%d/%Y', errors='coerce').values.astype('datetime64[D]'),
+            np.array(teams, dtype=str),
+            np.array(home, dtype=bool),
+            np.array(opponents, dtype=str),
+            pd.to_numeric(pd.Series(minutes, dtype=object), errors='coerce').to_numpy(np.float32),
+            np.array(stats, dtype=np.float32).reshape(len(dates), len(categories)),
+        )
+
+    @classmethod
+    def from_rows(cls, rows, categories):
+        # rows are [date, team, "Home"/"Away", minutes, *stats], the shape to_records gives back
+        return cls.from_columns(
+            categories,
+            [row[0] for row in rows],
+            [row[1] for row in rows],
+            [row[2] == 'Home' for row in rows],
+            [''] * len(rows),
+            [row[3] for row in rows],
+            [row[4:] for row in rows],
+        )
+
+    @classmethod
+    def from_document(cls, document):
+        categories = tuple(document['categories'])
+        minutes = [np.nan if value is None else value for value in document['minutes']]
+        return cls(
+            categories,
+            np.array([date or 'NaT' for date in document['date']], dtype='datetime64[D]'),
+            np.array(document['team'], dtype=str),
+            np.array(document['home'], dtype=bool),
+            # Documents written before opponents were kept don't have them
+            np.array(document.get('opponent') or [''] * len(minutes), dtype=str),
+            np.array(minutes, dtype=np.float32),
+            np.array([document['stats'][stat] for stat in categories], dtype=np.float32).T.reshape(-1, len(categories)),
+        )
+
+    def __len__(self):
+        return len(self.dates)
+
+    def select(self, mask):
+        return GameLog(self.categories, self.dates[mask], self.teams[mask], self.home[mask], self.opponents[mask],
+                       self.minutes[mask], self.stats[mask])
+
+    def averages(self):
+        if not len(self):
+            return {stat: 0 for stat in self.categories}
+        totals = self.stats.sum(axis=0, dtype=np.float64)
+        return {stat: round(float(total) / len(self), 1) for stat, total in zip(self.categories, totals)}
+
+    def __eq__(self, other):
+        return isinstance(other, GameLog) and self.to_document() == other.to_document()
+
+    def to_document(self):
+        # What gets stored in Mongo; api/getPlayerStatlines.js turns it back into rows
+        return {
+            'categories': list(self.categories),
+            'date': [None if np.isnat(date) else str(date) for date in self.dates],
+            'team': self.teams.tolist(),
+            'home': self.home.tolist(),
+            'opponent': self.opponents.tolist(),
+            'minutes': [None if np.isnan(minutes) else float(minutes) for minutes in self.minutes],
+            'stats': {stat: self.stats[:, i].tolist() for i, stat in enumerate(self.categories)},
+        }
 
-def get_statmuse_player_vs_team(player, opp_team, category):
-    url = format_statmuse_url(player, opp_team)
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+    def to_records(self):
+        # The old row-per-game lists, for anything that still wants them
+        records = []
+        for date, team, home, minutes, stats in zip(self.dates.tolist(), self.teams.tolist(), self.home.tolist(),
+                                                    self.minutes.tolist(), self.stats.tolist()):
+            records.append([
+                f"{date.month}/{date.day}/{date.year}" if date else '',
+                team,
+                "Home" if home else "Away",
+                '' if np.isnan(minutes) else f"{minutes:g}",
+                *stats,
+            ])
+        return records
+
+    def to_frame(self):
+        frame = pd.DataFrame({'game_date': self.dates, 'team': self.teams, 'home': self.home,
+                              'opponent': self.opponents, 'minutes': self.minutes})
+        for i, stat in enumerate(self.categories):
+            frame[stat] = self.stats[:, i]
+        return frame
+
+def statlines_frame(statlines):
+    # One row per game across every player_statlines document
+    frames = []
+    for document in statlines:
+        game_log = document['game_log']
+        if not isinstance(game_log, GameLog):
+            game_log = GameLog.from_document(game_log)
+        frame = game_log.to_frame()
+        frame.insert(0, 'date', document['date'])
+        frame.insert(1, 'player', document['player'])
+        frame.insert(2, 'opposing_team', document['opposing_team'])
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def export_statlines(statlines, path):
+    # to_parquet needs pyarrow (or fastparquet), which the scraper itself doesn't
+    try:
+        statlines_frame(statlines).to_parquet(path, index=False)
+    except ImportError as e:
+        print(f"Skipping Parquet export, install pyarrow to enable it: {e}")
+        return
+    print(f"Statlines written to {path}")
+
+def resolve_statmuse_columns(headers, category):
+    # Column positions, looked up once per table rather than per row and stat.
+    # The home/away marker has no header of its own and sits right after TM.
+    def position(name, default):
+        return headers.index(name) if name in headers else default
+
+    team = position('TM', 4)
+    return {
+        'name': position('NAME', 1),
+        'date': position('DATE', 3),
+        'team': team,
+        'location': team + 1,
+        'opponent': position('OPP', team + 2),
+        'minutes': position('MIN', 7),
+        'stats': [headers.index(stat) for stat in category],
     }
-    
-    response = requests.get(url, headers=headers)
-    soup = BeautifulSoup(response.content, 'html.parser')
-    
-    game_log = []  # List of lists to store statlines for each game
-    averages = {stat: 0 for stat in category}  # Dictionary to store average values for each stat
-    games_played = 0
 
-    table = soup.find('table')
+def statmuse_full_name(name):
+    # "LeBron James L. James" -> "LeBron James"
+    if '.' not in name:
+        return name
+    return " ".join(name.split('.')[0].split()[:-1])
+
+@timed_parse('www.statmuse.com')
+def parse_statmuse_game_log(content, category):
+    # Returns (GameLog, player name as statmuse lists it), or None without a table
+    table = make_soup(content, TABLE_STRAINER).find('table')
+    if not table:
+        return None
+
+    headers, values = read_table_cells(table)
+    width = len(headers)
+    rows = [values[i:i + width] for i in range(0, len(values), width)]
+    # More than one game adds Average and Total rows at the bottom
+    games = rows if len(rows) == 1 else rows[:-2]
+    if not games:
+        return GameLog.from_columns(category, [], [], [], [], [], []), ''
+
+    columns = resolve_statmuse_columns(headers, category)
+    stat_columns = columns['stats']
+    dates, teams, home, opponents, minutes, stats = [], [], [], [], [], []
+    for row in games:
+        dates.append(row[columns['date']])
+        teams.append(row[columns['team']])
+        home.append(row[columns['location']] == "vs")
+        opponents.append(row[columns['opponent']])
+        minutes.append(row[columns['minutes']])
+        # A blank cell counts as 0
+        stats.append([float(row[i]) if row[i].strip() else 0.0 for i in stat_columns])
+
+    game_log = GameLog.from_columns(category, dates, teams, home, opponents, minutes, stats)
+    return game_log, statmuse_full_name(games[0][columns['name']])
+
+def parse_statmuse_player_vs_team(content, category):
+    parsed = parse_statmuse_game_log(content, category)
+    if parsed is None:
+        return None
+
+    game_log, _ = parsed
+    return {
+        "game_log": game_log,  # Game-by-game stats, one column per field
+        "averages": game_log.averages(),  # Average stats per category
+        "games_played": len(game_log)  # Number of games played
+    }
 
-    if table:
-        headers = [th.get_text().strip() for th in table.find_all('th')]
-        values = [td.get_text().strip() for td in table.find_all('td')]
-        
-        # Create rows for each game
-        rows = [values[i:i + len(headers)] for i in range(0, len(values), len(headers))]
-
-        if len(rows) == 1: 
-            games_played = 1
-
-            row = rows[0]
-            game_statline = []
-
-            date = row[3]
-            player_team = row[4]
-            loc = "Home" if row[5] == "vs" else "Away"
-            minutes = row[7]
-            game_statline.extend([date, player_team, loc, minutes])
-            for stat in category:
-                stat_index = headers.index(stat)
-                stat_value = row[stat_index].strip()
-                
-                # If stat value is present, append it to the game log and update averages
-                if stat_value:
-                    stat_float = float(stat_value)
-                    game_statline.append(stat_float)
-                    averages[stat] += stat_float
-                else:
-                    game_statline.append(0.0)
-            game_log.append(game_statline)
-        else:
-            # Count the number of games (excluding the summary row)
-            games_played = len(rows) - 2  # Adjusted for possible summary row
-
-            # Loop through the game rows (excluding the summary)
-            for row in rows[:-2]:
-                game_statline = []
-
-                date = row[3]
-                player_team = row[4]
-                loc = "Home" if row[5] == "vs" else "Away"
-                minutes = row[7]
-                game_statline.extend([date, player_team, loc, minutes])
-                for stat in category:
-                    stat_index = headers.index(stat)
-                    stat_value = row[stat_index].strip()
-                    
-                    # If stat value is present, append it to the game log and update averages
-                    if stat_value:
-                        stat_float = float(stat_value)
-                        game_statline.append(stat_float)
-                        averages[stat] += stat_float
-                    else:
-                        game_statline.append(0.0)
-                game_log.append(game_statline)
-
-        # Calculate averages by dividing the total for each stat by games played
-        for stat in category:
-            if games_played > 0:
-                averages[stat] = round(averages[stat] / games_played, 1)
-    else:
+STATMUSE_REQUEST_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+}
+
+def get_statmuse_player_vs_team(player, opp_team, category, as_of=None):
+    url = format_statmuse_url(player, opp_team, as_of)
+    response = fetch(url, headers=STATMUSE_REQUEST_HEADERS)
+    historical_stats = parse_statmuse_player_vs_team(response.content, category)
+    if historical_stats is None:
         print(f"No data found for {player} vs {opp_team} on Statmuse.")
+        return {"game_log": GameLog.from_rows([], category), "averages": {stat: 0 for stat in category}, "games_played": 0}
+    return historical_stats
+
+def format_game_log_url(player, as_of, years=2):
+    # Every game over the window, whoever the opponent was
+    player_formatted = normalize_player_name(player)
+    return (f"https://www.statmuse.com/nba/ask/{player_formatted}-game-log-last-{years}-years-including-playoffs"
+            f"-before-{format_as_of(as_of)}")
+
+@functools.lru_cache(maxsize=1024)
+def get_statmuse_game_log(player, as_of, years, category):
+    # Memoized per process, so each backfill worker parses a player's log once
+    response = fetch(format_game_log_url(player, as_of, years), headers=STATMUSE_REQUEST_HEADERS)
+    return parse_statmuse_game_log(response.content, category)
+
+def season_start(date):
+    # NBA seasons tip off in October
+    year = date.year if date.month >= 10 else date.year - 1
+    return np.datetime64(f"{year}-10-01")
+
+def player_statistics_from_game_log(player_info, parsed, as_of, category):
+    # Derives both the vs-opponent history and the season averages from one
+    # multi-season game log, the way the two statmuse queries would slice it
+    game_log, name = parsed or (GameLog.from_columns(category, [], [], [], [], [], []), '')
+    cutoff = np.datetime64(as_of)
+    before = game_log.dates < cutoff
+    opponent = canonical_team(player_info['opposing_team'])
+    vs_team = game_log.select(
+        before
+        & (game_log.dates >= cutoff - np.timedelta64(2 * 365, 'D'))
+        # An opponent we can't name matches nothing, rather than every other unknown OPP
+        & np.array([opponent is not None and canonical_team(team) == opponent for team in game_log.opponents],
+                   dtype=bool)
+    )
+    season = game_log.select(before & (game_log.dates >= season_start(datetime.strptime(as_of, '%Y-%m-%d'))))
 
     return {
-        "game_log": game_log,  # List of lists where each sublist represents a game's stats
-        "averages": averages,  # Average stats per category
-        "games_played": games_played  # Number of games played
+        'player': name or player_info['player'],
+        'opposing_team': player_info['opposing_team'],
+        'defense_stats': player_info['defense_stats'],
+        'game_log': vs_team,
+        'averages': vs_team.averages(),
+        'games_played': len(vs_team),
+        # No games this season means no season averages, same as an empty statmuse answer
+        'season_averages': season.averages() if len(season) else {}
     }
 
-def format_season_averages_url(player):
-    player_formatted = "-".join(player.lower().split())
-    return f"https://www.statmuse.com/nba/ask?q={player_formatted}+averages+this+season"
+def format_season_averages_url(player, as_of=None):
+    player_formatted = normalize_player_name(player)
+    url = f"https://www.statmuse.com/nba/ask?q={player_formatted}+averages+this+season"
+    return f"{url}+before+{format_as_of(as_of).replace('-', '+')}" if as_of else url
 
-def get_statmuse_season_averages(player):
-    url = format_season_averages_url(player)
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
-    
+@timed_parse('www.statmuse.com')
+def parse_statmuse_season_averages(content):
     # Stats we want to focus on
     categories_mapping = {
         'PPG': 'PTS',
@@ -287,10 +1212,9 @@ def get_statmuse_season_averages(player):
         '3PM': '3PM'
     }
 
-    table = soup.find('table')  # Find the table in the response HTML
+    table = make_soup(content, TABLE_STRAINER).find('table')  # Find the table in the response HTML
     if table:
-        headers = [th.get_text().strip() for th in table.find_all('th')]
-        values = [td.get_text().strip() for td in table.find_all('td')]
+        headers, values = read_table_cells(table)
         
         # Create a dictionary from headers and values
         season_stats = dict(zip(headers, values))
@@ -308,224 +1232,1026 @@ def get_statmuse_season_averages(player):
     else:
         return '', {}
 
-def get_player_statistics(player_map):
-    player_stats = []
+def get_statmuse_season_averages(player, as_of=None):
+    url = format_season_averages_url(player, as_of)
+    response = fetch(url)
+    return parse_statmuse_season_averages(response.content)
+
+class PlayerRegistry:
+    # Memoizes season averages per normalized player name. With a path, entries
+    # are also kept across runs on the same day. Backfills pass as_of to get a
+    # registry of averages as they stood before that date.
+    def __init__(self, path=None, as_of=None):
+        self.path = path
+        self.as_of = as_of
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.season_averages = {}
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            saved = json.load(f)
+        # Season averages move after every game day, so only reuse today's
+        if saved.get('date') == self.date():
+            self.season_averages = {key: tuple(value) for key, value in saved['players'].items()}
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self.lock:
+            # Empty lookups may just be a failed fetch, so don't carry them over
+            players = {key: list(value) for key, value in self.season_averages.items() if value[1]}
+        with open(self.path, 'w') as f:
+            json.dump({'date': self.date(), 'players': players}, f)
+
+    def date(self):
+        return self.as_of or datetime.today().strftime('%Y-%m-%d')
+
+    def get_season_averages(self, player):
+        key = normalize_player_name(player)
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+
+        # Concurrent lookups of the same player wait for the first one
+        with key_lock:
+            with self.lock:
+                if key in self.season_averages:
+                    self.hits += 1
+                    return self.season_averages[key]
+                self.misses += 1
+
+            result = get_statmuse_season_averages(player, self.as_of)
+            # Same rule as save(): an empty lookup may be a failed fetch, so the
+            # next caller asks statmuse again instead of getting it back from here
+            if result[1]:
+                with self.lock:
+                    self.season_averages[key] = result
+            return result
+
+    def report(self):
+        run_stats.count('registry_hits', self.hits)
+        run_stats.count('registry_misses', self.misses)
+        print(f"Player registry: {self.hits} hits, {self.misses} misses")
+
+def collect_player_statistics(player_info, history_future, season_future):
+    opposing_team = player_info['opposing_team']
+    defense_stats = player_info['defense_stats']
 
-    for player_info in player_map:
-        player_name = player_info['player']
-        opposing_team = player_info['opposing_team']
-        defense_stats = player_info['defense_stats']
-        
+    try:
         # Get the stats for the player vs the opposing team (historical)
-        historical_stats = get_statmuse_player_vs_team(player_name, opposing_team, player_info['defense_stats'].keys())
-        game_log = historical_stats['game_log']
-        averages = historical_stats['averages']
-        games_played = historical_stats['games_played']
-        
+        historical_stats = history_future.result()
         # Get the player's season averages
-        fullname, season_averages = get_statmuse_season_averages(player_name)
-
-        player_stats.append({
-            'player': fullname,
-            'opposing_team': opposing_team,
-            'defense_stats': defense_stats,
-            'game_log': game_log,  # Detailed game-by-game statlines
-            'averages': averages,  # Historical averages vs the team
-            'games_played': games_played,
-            'season_averages': season_averages  # Season averages
-        })
+        fullname, season_averages = season_future.result()
+    except (requests.RequestException, CircuitOpenError) as e:
+        # Without season averages the player is left out of the final table
+        print(f"Failed to fetch statmuse data for {player_info['player']}: {e}")
+        historical_stats = {
+            "game_log": GameLog.from_rows([], defense_stats),
+            "averages": {stat: 0 for stat in defense_stats},
+            "games_played": 0,
+        }
+        fullname, season_averages = player_info['player'], {}
+
+    return {
+        'player': fullname,
+        'opposing_team': opposing_team,
+        'defense_stats': defense_stats,
+        'game_log': historical_stats['game_log'],  # Detailed game-by-game statlines
+        'averages': historical_stats['averages'],  # Historical averages vs the team
+        'games_played': historical_stats['games_played'],
+        'season_averages': season_averages  # Season averages
+    }
 
-    # print(player_stats)
-    return player_stats
+def stream_player_statistics(player_map, max_workers=None, registry=None, window=None):
+    # Yields each player's stats in input order as soon as they're ready.
+    # At most `window` players are in flight, so a slow consumer holds back
+    # new requests instead of piling up results in memory.
+    registry = registry or PlayerRegistry()
+    window = window or STREAM_WINDOW
+    # Opponent history is cut off at the same date as the season averages
+    as_of = registry.as_of
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=max_workers or MAX_WORKERS) as executor:
+        for info in player_map:
+            pending.append((
+                info,
+                executor.submit(get_statmuse_player_vs_team, info['player'], info['opposing_team'],
+                                info['defense_stats'].keys(), as_of),
+                executor.submit(registry.get_season_averages, info['player']),
+            ))
+            if len(pending) >= window:
+                yield collect_player_statistics(*pending.popleft())
+
+        while pending:
+            yield collect_player_statistics(*pending.popleft())
+
+    registry.report()
+
+def get_player_statistics(player_map, max_workers=None, registry=None):
+    # Both statmuse lookups for every player go into the same pool, so the
+    # stage takes roughly as long as its slowest few requests
+    return list(stream_player_statistics(player_map, max_workers, registry, window=len(player_map) or 1))
+
+@timed_parse('www.espn.com')
+def parse_injury_report(content):
+    soup = make_soup(content, INJURIES_STRAINER)
+    injury_report = []
+    teams_sections = soup.find_all('div', class_='ResponsiveTable Table__league-injuries')
+
+    for team_section in teams_sections:
+        team_name_tag = team_section.find('span', class_='injuries__teamName')
+        if not team_name_tag:
+            continue
+        team_name = team_name_tag.text.strip()
+        table = team_section.find('table')
+        if table:
+            players = table.find_all('tr')[1:]
+            for player_row in players:
+                player_data = player_row.find_all('td')
+                if len(player_data) >= 5:
+                    injury_report.append({
+                        'team': team_name,
+                        'player': player_data[0].text.strip(),
+                        'position': player_data[1].text.strip(),
+                        'est_return_date': player_data[2].text.strip(),
+                        'status_comment': player_data[4].text.strip()
+                    })
+
+    return injury_report
 
 def get_injury_report():
-    url = 'https://www.espn.com/nba/injuries'
+    url = ESPN_INJURIES_URL
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
     }
     try:
-        response = requests.get(url, headers=headers)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        injury_report = []
-        teams_sections = soup.find_all('div', class_='ResponsiveTable Table__league-injuries')
-
-        for team_section in teams_sections:
-            team_name_tag = team_section.find('span', class_='injuries__teamName')
-            if not team_name_tag:
-                continue
-            team_name = team_name_tag.text.strip()
-            table = team_section.find('table')
-            if table:
-                players = table.find_all('tr')[1:]
-                for player_row in players:
-                    player_data = player_row.find_all('td')
-                    if len(player_data) >= 5:
-                        injury_report.append({
-                            'team': team_name,
-                            'player': player_data[0].text.strip(),
-                            'position': player_data[1].text.strip(),
-                            'est_return_date': player_data[2].text.strip(),
-                            'status_comment': player_data[4].text.strip()
-                        })
+        response = fetch(url, headers=headers)
+        injury_report = parse_injury_report(response.content)
 
         df = pd.DataFrame(injury_report)
         if df.empty:
             print("Warning: Injury report came back empty — ESPN structure may have changed.")
-            return pd.DataFrame(columns=['team', 'player', 'position', 'est_return_date', 'status_comment'])
+            return pd.DataFrame(columns=INJURY_REPORT_COLUMNS)
         return df
 
     except Exception as e:
         print(f"Failed to fetch injury report: {e}")
-        return pd.DataFrame(columns=['team', 'player', 'position', 'est_return_date', 'status_comment'])
-
-def create_player_rankings():
+        return pd.DataFrame(columns=INJURY_REPORT_COLUMNS)
+
+class BatchWriter:
+    # With key_fields set, documents are upserted on those fields instead of inserted.
+    # name is what the writes are reported under, e.g. final_table for its staging copy.
+    def __init__(self, collection, batch_size=MONGO_BATCH_SIZE, retries=MONGO_WRITE_RETRIES, key_fields=None, name=None):
+        w = int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN
+        self.collection = collection.with_options(write_concern=pymongo.WriteConcern(w=w, wtimeout=MONGO_WTIMEOUT_MS))
+        self.name = name or collection.name
+        self.batch_size = batch_size
+        self.retries = retries
+        self.key_fields = key_fields
+        self.buffer = []
+        self.inserted = 0
+        self.batches = 0
+        self.write_time = 0.0
+
+    def add(self, document):
+        self.buffer.append(document)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def add_many(self, documents):
+        for document in documents:
+            self.add(document)
+
+    def write(self, batch):
+        if self.key_fields:
+            operations = [
+                pymongo.ReplaceOne({field: document[field] for field in self.key_fields}, document, upsert=True)
+                for document in batch
+            ]
+            result = self.collection.bulk_write(operations, ordered=False)
+            return result.upserted_count + result.modified_count
+        return len(self.collection.insert_many(batch, ordered=False).inserted_ids)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                self.inserted += self.write(batch)
+                break
+            except pymongo.errors.BulkWriteError as e:
+                # insert_many assigns _ids up front, so on a retry the documents
+                # that made it through the first time come back as duplicates
+                errors = e.details.get('writeErrors', [])
+                if attempt == 0 or any(error['code'] != 11000 for error in errors):
+                    raise
+                self.inserted += len(batch)
+                break
+            except pymongo.errors.AutoReconnect:
+                if attempt == self.retries:
+                    raise
+                time.sleep(2 ** attempt)
+        self.batches += 1
+        self.write_time += time.perf_counter() - start
+
+    def report(self):
+        run_stats.record_writes(self.name, self.inserted, self.batches, self.write_time)
+        print(f"{self.name}: wrote {self.inserted} documents in {self.batches} batches ({self.write_time:.2f}s)")
+
+def connect_mongo(db_uri):
+    return pymongo.MongoClient(db_uri, server_api=pymongo.server_api.ServerApi('1'), retryWrites=MONGO_RETRY_WRITES)
+
+def ensure_indexes(collection, name=None):
+    indexes = COLLECTION_INDEXES.get(name or collection.name)
+    if indexes:
+        collection.create_indexes([pymongo.IndexModel(keys, **options) for keys, options in indexes])
+
+def document_hash(document):
+    content = {key: value for key, value in document.items() if key not in ('_id', '_hash')}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+class CollectionPublisher:
+    # Publishes a full set of documents to a collection without readers ever
+    # seeing it empty or half written
+    def __init__(self, db, name, mode=DEFAULT_WRITE_MODE, batch_size=MONGO_BATCH_SIZE, key_fields=DOCUMENT_KEY,
+                 allow_empty=False):
+        if mode not in WRITE_MODES:
+            raise ValueError(f"Unknown write mode {mode!r}, expected one of {WRITE_MODES}")
+        self.db = db
+        self.name = name
+        self.mode = mode
+        self.key_fields = key_fields
+        self.allow_empty = allow_empty
+        self.unchanged = 0
+
+        if mode == 'swap':
+            staging = db[name + '_staging']
+            staging.drop()
+            self.writer = BatchWriter(staging, batch_size, name=name)
+        else:
+            # Every upsert filters on the key fields, so index them first
+            ensure_indexes(db[name])
+            self.writer = BatchWriter(db[name], batch_size, key_fields=key_fields)
+            # Content hash of every live document, so unchanged ones are skipped
+            # and anything not republished this run can be removed at commit
+            projection = {field: 1 for field in key_fields}
+            projection['_hash'] = 1
+            self.existing = {
+                self.key(document): (document['_id'], document.get('_hash'))
+                for document in db[name].find({}, projection)
+            }
+            self.seen = set()
+            # Changed documents wait here until commit() has checked the run
+            # is complete enough to publish, so a short run never touches live data
+            self.pending = []
+
+    def key(self, document):
+        return tuple(document.get(field) for field in self.key_fields)
+
+    def add(self, document):
+        if self.mode == 'upsert':
+            key = self.key(document)
+            document['_hash'] = document_hash(document)
+            self.seen.add(key)
+            if key in self.existing and self.existing[key][1] == document['_hash']:
+                self.unchanged += 1
+                return
+            self.pending.append(document)
+            return
+        self.writer.add(document)
+
+    def add_many(self, documents):
+        for document in documents:
+            self.add(document)
+
+    def commit(self, expected=None):
+        # expected is how many documents this run should have produced; without
+        # it the run is measured against what's live. Returns whether it published.
+        self.writer.flush()
+
+        produced = self.writer.inserted if self.mode == 'swap' else len(self.seen)
+        if expected is None:
+            expected = len(self.existing) if self.mode == 'upsert' else self.db[self.name].estimated_document_count()
+        if not self.allow_empty and (produced == 0 or produced < MIN_PUBLISH_FRACTION * expected):
+            # A failed scrape looks just like an empty day; don't let it blank the site
+            print(f"{self.name}: run produced {produced} documents against {expected} expected, keeping the live data "
+                  f"(pass --allow-empty to publish anyway)")
+            if self.mode == 'swap':
+                self.writer.collection.drop()
+            else:
+                self.pending = []
+            return False
+
+        if self.mode == 'swap':
+            staging = self.writer.collection
+            if staging.estimated_document_count():
+                # Building indexes after the bulk load is cheaper than keeping them up during it
+                ensure_indexes(staging, self.name)
+                staging.rename(self.name, dropTarget=True)
+            else:
+                self.db[self.name].drop()
+        else:
+            self.writer.add_many(self.pending)
+            self.writer.flush()
+            self.pending = []
+            stale = [document_id for key, (document_id, _) in self.existing.items() if key not in self.seen]
+            if stale:
+                self.db[self.name].delete_many({'_id': {'$in': stale}})
+            print(f"{self.name}: {self.unchanged} unchanged, {len(stale)} removed")
+        return True
+
+    def report(self):
+        self.writer.report()
+
+class DryRunPublisher:
+    # Takes CollectionPublisher's place when nothing should reach Mongo
+    def __init__(self, name):
+        self.name = name
+        self.documents = 0
+
+    def add(self, document):
+        self.documents += 1
+
+    def add_many(self, documents):
+        for document in documents:
+            self.add(document)
+
+    def commit(self, expected=None):
+        return True
+
+    def report(self):
+        print(f"{self.name}: {self.documents} documents (dry run, nothing written)")
+
+NAME_SUFFIXES = {'jr', 'sr', 'ii', 'iii', 'iv', 'v'}
+# Known name differences between ESPN and statmuse, by match key
+PLAYER_ALIASES = {}
+LAST_NAME_MATCH_CUTOFF = 0.85
+
+def player_match_key(name):
+    # Sources disagree on accents, punctuation, case and generational suffixes
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()
+    words = re.sub(r"[^a-z0-9 ]", "", name.lower().replace('-', ' ')).split()
+    while words and words[-1] in NAME_SUFFIXES:
+        words.pop()
+    key = " ".join(words)
+    return PLAYER_ALIASES.get(key, key)
+
+def is_close_name(key, candidate):
+    first, _, last = key.partition(' ')
+    candidate_first, _, candidate_last = candidate.partition(' ')
+    # Shortened first name with the same last name (Nic / Nicolas Claxton)
+    if last == candidate_last and (first.startswith(candidate_first) or candidate_first.startswith(first)):
+        return True
+    # Same first name with a differently spelled last name (Schroder / Schroeder)
+    if first == candidate_first:
+        return difflib.SequenceMatcher(None, last, candidate_last).ratio() >= LAST_NAME_MATCH_CUTOFF
+    return False
+
+class InjuryIndex:
+    # Match key -> status comment, built once per run from the injury report
+    def __init__(self, injury_report):
+        self.statuses = {}
+        for player, status in zip(injury_report['player'], injury_report['status_comment']):
+            self.statuses.setdefault(player_match_key(player), status)
+
+        # Fuzzy candidates share either a first or a last name with the lookup
+        self.by_name_part = {}
+        for key in self.statuses:
+            first, _, last = key.partition(' ')
+            self.by_name_part.setdefault(('first', first), []).append(key)
+            self.by_name_part.setdefault(('last', last), []).append(key)
+        self.fuzzy_matches = {}
+
+    def lookup(self, player):
+        key = player_match_key(player)
+        if key in self.statuses:
+            return self.statuses[key]
+
+        # Only trust a fuzzy match when it's unambiguous. Similar looking
+        # first names (Jaden / Jalen McDaniels) are different players.
+        if key not in self.fuzzy_matches:
+            first, _, last = key.partition(' ')
+            candidates = set(self.by_name_part.get(('first', first), []) + self.by_name_part.get(('last', last), []))
+            matches = [name for name in candidates if ' ' in key and is_close_name(key, name)]
+            self.fuzzy_matches[key] = self.statuses[matches[0]] if len(matches) == 1 else ''
+        return self.fuzzy_matches[key]
+
+def build_final_table(player_history, categories, injury_index, date):
+    rows = [data for data in player_history if data['opposing_team'] and data['season_averages']]
+    if not rows:
+        return []
+
+    index = pd.MultiIndex.from_tuples([(data['player'], data['opposing_team']) for data in rows],
+                                      names=['player', 'opposing_team'])
+
+    def numeric_frame(key):
+        frame = pd.DataFrame([data[key] for data in rows], index=index, columns=categories)
+        return frame.apply(pd.to_numeric, errors='coerce')
+
+    # Historical and season averages side by side; a zero historical average
+    # means no games against this team, so it has no differential
+    averages = numeric_frame('averages')
+    season_averages = numeric_frame('season_averages')
+    differentials = (averages.where(averages != 0) - season_averages).round(1)
+    ranks = numeric_frame('defense_stats').astype('Int64')
+
+    table = pd.DataFrame({
+        'date': date,
+        'games_played': [data['games_played'] for data in rows],
+        'injury_note': [injury_index.lookup(player) for player in index.get_level_values('player')],
+    }, index=index)
+    for category in categories:
+        table[category] = differentials[category]
+        table[category + '_rank'] = ranks[category]
+
+    # Drop players whose differentials are all exactly zero
+    table = table[(differentials != 0).any(axis=1)].reset_index()
+
+    # Missing values go out as '' for differentials and None for ranks,
+    # matching the documents the site already reads
+    rank_columns = [category + '_rank' for category in categories]
+    table[categories] = table[categories].astype(object).where(table[categories].notna(), '')
+    table[rank_columns] = table[rank_columns].astype(object).where(table[rank_columns].notna(), None)
+
+    columns = ['date', 'player', 'opposing_team', 'games_played', 'injury_note']
+    for category in categories:
+        columns += [category, category + '_rank']
+    return table[columns].to_dict('records')
+
+def publish_player_statistics(player_stream, categories, injury_index, date, final_table_publisher,
+                              player_statlines_publisher, chunk_size=FINAL_TABLE_CHUNK, exported=None, slate_rows=None):
+    # Consumes players as they arrive, in chunks small enough to keep memory
+    # flat but big enough for build_final_table to stay vectorized
+    final_rows = 0
+    sample_row = None
+    chunk = []
+
+    def flush_chunk():
+        nonlocal final_rows, sample_row
+        rows = build_final_table(chunk, categories, injury_index, date)
+        final_table_publisher.add_many(rows)
+        final_rows += len(rows)
+        if slate_rows is not None:
+            slate_rows.extend(rows)
+        if sample_row is None and rows:
+            sample_row = rows[0]
+        chunk.clear()
+
+    for player_data in player_stream:
+        if player_data['opposing_team'] and player_data['season_averages']:
+            # Upload the game log to MongoDB's player_statlines collection
+            statline = {
+                "date": date,
+                "player": player_data['player'],
+                "opposing_team": player_data['opposing_team'],
+                "game_log": player_data['game_log'].to_document()
+            }
+            player_statlines_publisher.add(statline)
+            if exported is not None:
+                exported.append(statline)
+
+        chunk.append(player_data)
+        if len(chunk) >= chunk_size:
+            flush_chunk()
+
+    if chunk:
+        flush_chunk()
+
+    return final_rows, sample_row
+
+def publish_slate(db, date, rows, matchups, allow_empty=False):
+    # The whole slate as one document, so /api/getPlayers is a single indexed
+    # lookup instead of a scan of final_table
+    players = [{key: value for key, value in row.items() if key not in ('_id', '_hash')} for row in rows]
+    if not players and not allow_empty:
+        print(f"slates: no players for {date}, keeping the published slate")
+        return
+    slates = db['slates']
+    ensure_indexes(slates)
+    slates.replace_one({'date': date}, {'date': date, 'matchups': matchups, 'players': players}, upsert=True)
+    print(f"slates: published {len(players)} players for {date}")
+
+def create_player_rankings(registry=None, batch_size=MONGO_BATCH_SIZE, write_mode=DEFAULT_WRITE_MODE, report_path=RUN_REPORT_PATH,
+                           export_path=None, dry_run=False, allow_empty=False):
     db_uri = os.getenv("MONGODB_URI")
-    if not db_uri:
+    if not db_uri and not dry_run:
         raise ValueError("MONGODB_URI is not set in environment variables.")
 
+    run_stats.reset()
+    client = None
     try:
-        client = MongoClient(db_uri, server_api=ServerApi('1'))
-        db = client['nba_stats']
-
-        matchups_collection = db['matchups']
-        final_table_collection = db['final_table']
-        player_statlines_collection = db['player_statlines'] 
-
-        # Clear old data by dropping the collections
-        print("Dropping old data...")
-        matchups_collection.drop()
-        final_table_collection.drop()
-        player_statlines_collection.drop() 
+        today = datetime.today().strftime('%Y-%m-%d')
 
-        # Recreate collections after dropping
-        matchups_collection = db['matchups']
-        final_table_collection = db['final_table']
-        player_statlines_collection = db['player_statlines']
+        if dry_run:
+            # Scrape and build everything, but only count what would be written
+            db = None
+            final_table_publisher = DryRunPublisher('final_table')
+            player_statlines_publisher = DryRunPublisher('player_statlines')
+        else:
+            client = connect_mongo(db_uri)
+            db = client['nba_stats']
+            matchups_collection = db['matchups']
+
+            # The live collections stay readable until commit replaces their contents
+            print(f"Preparing {write_mode} write...")
+            final_table_publisher = CollectionPublisher(db, 'final_table', write_mode, batch_size, allow_empty=allow_empty)
+            player_statlines_publisher = CollectionPublisher(db, 'player_statlines', write_mode, batch_size,
+                                                             allow_empty=allow_empty)
+
+        exported = [] if export_path else None
+
+        def lineups():
+            print("Fetching lineups")
+            lineups = scrape_nba_lineups()
+            run_stats.count('games', len(lineups))
+            return lineups
+
+        def fantasypros():
+            print("Fetching FantasyPros defense vs position")
+            return build_rank_table(scrape_fantasypros_defense_vs_position(), CATEGORIES)
+
+        def injuries():
+            print("Getting injury report")
+            injury_report = get_injury_report()
+            print("Injury report columns:", injury_report.columns.tolist())
+            print("Injury report shape:", injury_report.shape)
+            run_stats.count('injuries', len(injury_report))
+            return InjuryIndex(injury_report)
+
+        def player_map(lineups, fantasypros):
+            player_defense_map = build_player_defense_map(lineups, fantasypros, CATEGORIES)
+            run_stats.count('players', len(player_defense_map))
+            return player_defense_map
+
+        def statmuse_to_mongo(player_map, injuries):
+            # Each player flows from statmuse through the final table and into
+            # the Mongo write buffers as soon as its pages are in
+            print("Fetching statmuse and finalizing table")
+            player_stream = stream_player_statistics(player_map, registry=registry)
+            slate_rows = []
+            final_rows, sample_row = publish_player_statistics(
+                player_stream, CATEGORIES, injuries, today, final_table_publisher, player_statlines_publisher,
+                exported=exported, slate_rows=slate_rows
+            )
+            if registry:
+                registry.save()
+            run_stats.count('final_table_rows', final_rows)
+            print("Final table length:", final_rows)
+            print("Sample row:", [sample_row] if sample_row else [])
+            return slate_rows
+
+        def publish(lineups, player_map, statmuse_to_mongo):
+            # Every starter in the lineups should have made it into both collections
+            published = final_table_publisher.commit(expected=len(player_map))
+            player_statlines_publisher.commit(expected=len(player_map))
+
+            # Extract only the matchups (away/home teams)
+            matchups = [{'time': game['time'], 'away_team': game['away_team'], 'home_team': game['home_team']} for game in lineups]
+            if dry_run:
+                print(f"matchups: {len(matchups)} games (dry run, nothing written)")
+                return
+
+            # Matchups and the slate follow final_table: if that was held back, so are they
+            if not published:
+                return
+
+            # Insert today's matchups into MongoDB
+            matchup_entry = {'date': today, 'matchups': matchups}
+
+            # Upsert to avoid duplicate entries for the same date
+            ensure_indexes(matchups_collection)
+            matchups_collection.update_one({'date': today}, {'$set': matchup_entry}, upsert=True)
+
+            publish_slate(db, today, statmuse_to_mongo, matchups, allow_empty)
+
+        # Lineups, FantasyPros and ESPN don't depend on each other, so they
+        # run side by side; statmuse waits only for what it needs
+        run_dag([
+            Task('lineups', lineups, retries=1),
+            # Rankings are a nice-to-have; the slate still publishes without them
+            Task('fantasypros', fantasypros, retries=1, optional=True),
+            Task('injuries', injuries, retries=1),
+            Task('player_map', player_map, deps=['lineups', 'fantasypros']),
+            Task('statmuse_to_mongo', statmuse_to_mongo, deps=['player_map', 'injuries']),
+            Task('publish', publish, deps=['lineups', 'player_map', 'statmuse_to_mongo']),
+        ])
+
+        player_statlines_publisher.report()
+        final_table_publisher.report()
+        if export_path:
+            export_statlines(exported, export_path)
+        print_fetch_metrics()
+        print("Dry run finished" if dry_run else "Data uploaded to MongoDB successfully")
 
-        print("Fetching lineups")
+    except Exception as e:
+        print(f"Error occurred: {e}")
+    
+    finally:
+        # Close MongoDB connection
+        if client is not None:
+            client.close()
+            print("MongoDB connection closed.")
+        if report_path:
+            run_stats.write(report_path)
+
+class SlateWatcher:
+    # Remembers what was last published for today's slate and, on each poll,
+    # rewrites only the games and players whose content hash moved
+    def __init__(self, db, date, categories, rank_table, registry=None, batch_size=MONGO_BATCH_SIZE):
+        self.db = db
+        self.date = date
+        self.categories = categories
+        self.rank_table = rank_table
+        self.registry = registry or PlayerRegistry()
+        self.batch_size = batch_size
+        self.game_hashes = {}
+        self.player_hashes = {}
+        self.player_data = {}  # (lineup name, opponent) -> statmuse results
+        self.rows = {}  # (lineup name, opponent) -> final table row
+        self.matchups = []
+
+    def poll(self):
         lineups = scrape_nba_lineups()
+        injury_index = InjuryIndex(get_injury_report())
+        players = {(info['player'], info['opposing_team']): info
+                   for info in build_player_defense_map(lineups, self.rank_table, self.categories)}
+        # A blocked or redesigned lineups page parses as an empty or thin slate;
+        # acting on it would delete today's documents, so keep the last snapshot
+        if not lineups or len(players) < MIN_PUBLISH_FRACTION * len(self.player_hashes):
+            raise RuntimeError(f"lineups came back with {len(lineups)} games and {len(players)} players "
+                               f"against {len(self.player_hashes)} last poll, keeping the previous snapshot")
+
+        game_hashes = {(game['away_team'], game['home_team']): document_hash(game) for game in lineups}
+        # A player's hash covers their lineup slot, opponent ranks and injury status
+        player_hashes = {
+            key: document_hash({**info, 'injury_note': injury_index.lookup(info['player'])})
+            for key, info in players.items()
+        }
+        changed = [key for key, value in player_hashes.items() if self.player_hashes.get(key) != value]
+        removed = [key for key in self.player_hashes if key not in player_hashes]
+        games_changed = game_hashes != self.game_hashes
+
+        # Players whose last statmuse fetch came back empty are retried on
+        # every poll, whether or not anything about them changed
+        retried = [key for key in players if key not in changed
+                   and key in self.player_data and not self.player_data[key]['season_averages']]
+        refreshed = changed + retried
+
+        # Statmuse only depends on who plays whom, so slot and injury changes
+        # reuse what we already have
+        to_fetch = [players[key] for key in refreshed
+                    if key not in self.player_data or not self.player_data[key]['season_averages']]
+        # The empty answers are still in the HTTP cache, so a retry has to go past it
+        cache = get_cache()
+        if cache:
+            for key in retried:
+                cache.delete(format_statmuse_url(key[0], key[1], self.registry.as_of))
+                cache.delete(format_season_averages_url(key[0], self.registry.as_of))
+        final_table = BatchWriter(self.db['final_table'], self.batch_size, key_fields=DOCUMENT_KEY)
+        player_statlines = BatchWriter(self.db['player_statlines'], self.batch_size, key_fields=DOCUMENT_KEY)
+        for info, player_data in zip(to_fetch, stream_player_statistics(to_fetch, registry=self.registry)):
+            key = (info['player'], info['opposing_team'])
+            self.player_data[key] = player_data
+            if player_data['season_averages']:
+                player_statlines.add(self.document({
+                    "date": self.date,
+                    "player": player_data['player'],
+                    "opposing_team": player_data['opposing_team'],
+                    "game_log": player_data['game_log'].to_document()
+                }))
+
+        # A retry that still came back empty leaves nothing new to publish
+        recovered = [key for key in retried if self.player_data[key]['season_averages']]
+        for key in changed + recovered:
+            player_data = dict(self.player_data[key], defense_stats=players[key]['defense_stats'])
+            rows = build_final_table([player_data], self.categories, injury_index, self.date)
+            if rows:
+                self.rows[key] = rows[0]
+                final_table.add(self.document(rows[0]))
+
+        for key in removed:
+            # Players who dropped out of the lineups lose their documents
+            self.rows.pop(key, None)
+            player_data = self.player_data.pop(key, None)
+            if player_data:
+                document_key = {'date': self.date, 'player': player_data['player'], 'opposing_team': key[1]}
+                self.db['final_table'].delete_many(document_key)
+                self.db['player_statlines'].delete_many(document_key)
+
+        final_table.flush()
+        player_statlines.flush()
+
+        if games_changed:
+            self.matchups = [{'time': game['time'], 'away_team': game['away_team'], 'home_team': game['home_team']}
+                             for game in lineups]
+            self.db['matchups'].update_one({'date': self.date}, {'$set': {'date': self.date, 'matchups': self.matchups}},
+                                           upsert=True)
+        if changed or recovered or removed or games_changed:
+            publish_slate(self.db, self.date, list(self.rows.values()), self.matchups)
+
+        self.game_hashes = game_hashes
+        self.player_hashes = player_hashes
+        return {'games_changed': games_changed, 'players_changed': len(changed), 'fetched': len(to_fetch),
+                'removed': len(removed)}
+
+    def document(self, document):
+        # Same content hash the upsert publisher keeps, so a later upsert run
+        # still recognizes these documents as unchanged
+        document['_hash'] = document_hash(document)
+        return document
+
+def watch(interval=WATCH_INTERVAL, polls=None, registry=None, batch_size=MONGO_BATCH_SIZE, report_path=RUN_REPORT_PATH):
+    db_uri = os.getenv("MONGODB_URI")
+    if not db_uri:
+        raise ValueError("MONGODB_URI is not set in environment variables.")
 
-        print("Skipping FantasyPros — using raw lineups only")
-        
-        categories = ['PTS', 'REB', 'AST', '3PM', 'STL', 'BLK']
-        
-        player_defense_map = []
-        
-        for game in lineups:
-            for pos, player, team in game['home_lineup']:
-                player_defense_map.append({
-                    'player': player,
-                    'position': pos,
-                    'player_team': team,
-                    'opposing_team': game['away_team'],
-                    'defense_stats': {cat: None for cat in categories}
-                })
-        
-            for pos, player, team in game['away_lineup']:
-                player_defense_map.append({
-                    'player': player,
-                    'position': pos,
-                    'player_team': team,
-                    'opposing_team': game['home_team'],
-                    'defense_stats': {cat: None for cat in categories}
-                })
-
-        print("Fetching statmuse")
-        player_history = get_player_statistics(player_defense_map)
-
-        print("Getting injury report")
-        injury_report = get_injury_report()
-        print("Injury report columns:", injury_report.columns.tolist())
-        print("Injury report shape:", injury_report.shape)
-
-        print("Finalizing Table")
-        final_table = []
-
-        for player_data in player_history:
-            player = player_data['player']
-            opposing_team = player_data['opposing_team']
-            season_averages = player_data['season_averages']
-            games_played = player_data['games_played']
-
-            if not opposing_team or not season_averages:
-                continue
-
-            # Initialize the row for each player
-            stats_row = {
-                'player': player,
-                'opposing_team': opposing_team,
-                'games_played': games_played
-            }
-
-            game_log = player_data['game_log']
-
-            # Upload the game log to MongoDB's player_statlines collection
-            player_statline_data = {
-                "player": player,
-                "opposing_team": opposing_team,
-                "game_log": game_log
-            }
-            player_statlines_collection.insert_one(player_statline_data)
+    # The polled pages are revalidated every time (a cheap 304 when nothing
+    # moved); everything else keeps its usual cache lifetime
+    for prefix in WATCHED_URLS:
+        CACHE_TTLS[prefix] = 0
 
-            # Check if the player is on the injury report
-            injury_info = injury_report[injury_report['player'] == player]
-            if not injury_info.empty:
-                injury_note = injury_info.iloc[0]['status_comment']
-                stats_row['injury_note'] = injury_note
+    run_stats.reset()
+    totals = {'polls': 0, 'players_changed': 0, 'fetched': 0, 'removed': 0}
+    client = connect_mongo(db_uri)
+    try:
+        db = client['nba_stats']
+        for collection in ['final_table', 'player_statlines', 'matchups']:
+            ensure_indexes(db[collection])
+
+        try:
+            rank_table = build_rank_table(scrape_fantasypros_defense_vs_position(), CATEGORIES)
+        except Exception as e:
+            print(f"Failed to fetch FantasyPros rankings, continuing without them: {e}")
+            rank_table = None
+
+        watcher = SlateWatcher(db, datetime.today().strftime('%Y-%m-%d'), CATEGORIES, rank_table, registry, batch_size)
+        while polls is None or totals['polls'] < polls:
+            if totals['polls']:
+                time.sleep(interval)
+            started = time.perf_counter()
+            try:
+                changes = watcher.poll()
+            except Exception as e:
+                # A bad poll shouldn't end the watch; the next one starts from the last good snapshot
+                print(f"Poll failed: {e}")
+                changes = {'players_changed': 0, 'fetched': 0, 'removed': 0}
             else:
-                stats_row['injury_note'] = ''
-
-            # Process final stat values and defense rankings
-            for category in categories:
-                avg = player_data['averages'].get(category, '')
-                season_avg = season_averages.get(category, '')
-
-                if avg and season_avg:
-                    difference = round(float(avg) - float(season_avg), 1)
-                else:
-                    difference = ''
-
-                if category in player_data['defense_stats']:
-                    defense_rank = player_data['defense_stats'].get(category)
-                    stats_row[category] = difference
-                    stats_row[category + '_rank'] = defense_rank
-                else:
-                    stats_row[category] = ''
-                    stats_row[category + '_rank'] = ''
-
-            final_table.append(stats_row)
-
-        print("Final table length:", len(final_table))
-        print("Sample row:", final_table[:1])
-        # Convert final table to DataFrame and filter non-zero rows
-        df_final = pd.DataFrame(final_table)
-        
-        print("DataFrame columns:", df_final.columns)
-        
-        df_final_filtered = df_final[(df_final[categories] != 0).any(axis=1)]
-
-        # Insert df_final_filtered into MongoDB
-        final_table_collection.insert_many(df_final_filtered.to_dict('records'))
-
-        # Extract only the matchups (away/home teams)
-        matchups = [{'time': game['time'], 'away_team': game['away_team'], 'home_team': game['home_team']} for game in lineups]
+                print(f"Poll {totals['polls'] + 1}: {changes['players_changed']} players changed, "
+                      f"{changes['fetched']} fetched from statmuse, {changes['removed']} removed"
+                      f"{', matchups updated' if changes['games_changed'] else ''} "
+                      f"({time.perf_counter() - started:.1f}s)")
+            totals['polls'] += 1
+            for name in ('players_changed', 'fetched', 'removed'):
+                totals[name] += changes[name]
+    except KeyboardInterrupt:
+        print("Watch stopped")
+    finally:
+        client.close()
+        if registry:
+            registry.save()
+        for name, value in totals.items():
+            run_stats.count(f"watch_{name}", value)
+        if report_path:
+            run_stats.write(report_path)
+
+def init_backfill_worker(cache_enabled, offline, cache_path, processes):
+    global _session, _cache, DEFAULT_HOST_RATE, HOST_RATES
+    # Forked workers must not reuse the parent's sockets or sqlite handle.
+    # Every process limits itself separately, so split each host's rate
+    # between them to keep the total where it was.
+    _session = None
+    _cache = None
+    _host_semaphores.clear()
+    _host_limiters.clear()
+    DEFAULT_HOST_RATE /= processes
+    HOST_RATES = {host: rate / processes for host, rate in HOST_RATES.items()}
+    configure_cache(enabled=cache_enabled, offline=offline, path=cache_path)
+
+def backfill_date(date, window_end, years, categories=None):
+    # Runs in a worker process and hands the documents back to the parent,
+    # which owns the Mongo connection
+    categories = categories or CATEGORIES
+    start = time.perf_counter()
+    lineups = scrape_nba_lineups(date)
+
+    # FantasyPros and ESPN only publish the current picture, so backfilled
+    # rows carry no ranks or injury notes rather than leaking today's
+    player_map = build_player_defense_map(lineups, None, categories)
+    injury_index = InjuryIndex(pd.DataFrame(columns=INJURY_REPORT_COLUMNS))
+
+    # One game log per player covers every date and opponent in the window,
+    # so it's the same cached page whichever date asks for it
+    def player_statistics(player_info):
+        try:
+            parsed = get_statmuse_game_log(player_info['player'], window_end, years, tuple(categories))
+        except (requests.RequestException, CircuitOpenError) as e:
+            print(f"Failed to fetch statmuse data for {player_info['player']}: {e}")
+            parsed = None
+        return player_statistics_from_game_log(player_info, parsed, date, categories)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        player_history = list(executor.map(player_statistics, player_map))
+
+    statlines = [
+        {"date": date, "player": data['player'], "opposing_team": data['opposing_team'],
+         "game_log": data['game_log'].to_document()}
+        for data in player_history if data['opposing_team'] and data['season_averages']
+    ]
+    matchups = [{'time': game['time'], 'away_team': game['away_team'], 'home_team': game['home_team']} for game in lineups]
+    return {
+        'date': date,
+        'matchups': matchups,
+        'final_table': build_final_table(player_history, categories, injury_index, date),
+        'player_statlines': statlines,
+        'seconds': time.perf_counter() - start,
+    }
 
-        # Insert today's matchups into MongoDB
-        today = datetime.today().strftime('%Y-%m-%d')
-        matchup_entry = {'date': today, 'matchups': matchups}
+def date_range(start, end):
+    day = datetime.strptime(start, '%Y-%m-%d')
+    last = datetime.strptime(end, '%Y-%m-%d')
+    while day <= last:
+        yield day.strftime('%Y-%m-%d')
+        day += timedelta(days=1)
 
-        # Upsert to avoid duplicate entries for the same date
-        matchups_collection.update_one({'date': today}, {'$set': matchup_entry}, upsert=True)
+def backfill(start, end, processes=BACKFILL_PROCESSES, batch_size=MONGO_BATCH_SIZE,
+             report_path=RUN_REPORT_PATH, export_path=None):
+    db_uri = os.getenv("MONGODB_URI")
+    if not db_uri:
+        raise ValueError("MONGODB_URI is not set in environment variables.")
 
-        print("Data uploaded to MongoDB successfully")
+    dates = list(date_range(start, end))
+    processes = max(1, min(processes, len(dates)))
+    # Enough history for the first date's two-year lookback
+    years = 2 + -(-len(dates) // 365)
+    run_stats.reset()
+    client = connect_mongo(db_uri)
+    try:
+        db = client['nba_stats']
+        # Upserts on (date, player, opposing_team), so a rerun of any range
+        # replaces those dates and leaves the rest of the history alone
+        for collection in list(HISTORY_COLLECTIONS.values()) + ['matchups']:
+            ensure_indexes(db[collection])
+        writers = {
+            name: BatchWriter(db[collection], batch_size, key_fields=DOCUMENT_KEY)
+            for name, collection in HISTORY_COLLECTIONS.items()
+        }
 
-    except Exception as e:
-        print(f"Error occurred: {e}")
-    
+        print(f"Backfilling {len(dates)} dates from {start} to {end} with {processes} processes")
+        player_games = 0
+        failed = []
+        exported = []
+        with run_stats.stage('backfill'):
+            with ProcessPoolExecutor(max_workers=processes, initializer=init_backfill_worker,
+                                     initargs=(CACHE_ENABLED, OFFLINE, CACHE_PATH, processes)) as executor:
+                futures = {executor.submit(backfill_date, date, end, years): date for date in dates}
+                for future in as_completed(futures):
+                    date = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print(f"Backfill failed for {date}: {e}")
+                        failed.append(date)
+                        continue
+
+                    for name, writer in writers.items():
+                        writer.add_many(result[name])
+                    db['matchups'].update_one({'date': date}, {'$set': {'date': date, 'matchups': result['matchups']}},
+                                              upsert=True)
+                    player_games += len(result['final_table'])
+                    if export_path:
+                        exported.extend(result['player_statlines'])
+                    print(f"{date}: {len(result['matchups'])} games, {len(result['final_table'])} players "
+                          f"in {result['seconds']:.1f}s")
+
+            for writer in writers.values():
+                writer.flush()
+
+        run_stats.count('dates', len(dates) - len(failed))
+        run_stats.count('failed_dates', failed)
+        run_stats.count('player_games', player_games)
+        elapsed = run_stats.stages[-1]['wall']
+        print(f"Backfilled {player_games} player-games in {elapsed:.1f}s "
+              f"({player_games / elapsed if elapsed else 0:.1f} player-games/s)")
+        for writer in writers.values():
+            writer.report()
+        if export_path:
+            export_statlines(exported, export_path)
     finally:
-        # Close MongoDB connection
         client.close()
-        print("MongoDB connection closed.")
+        if report_path:
+            run_stats.write(report_path)
+
+def print_lineups(args):
+    for game in scrape_nba_lineups(args.date):
+        print(f"{game['time']}: {game['away_team']} @ {game['home_team']}")
+        for side in ('away_lineup', 'home_lineup'):
+            print("  " + ", ".join(f"{player} ({pos})" for pos, player, _ in game[side]))
+
+def print_injuries(args):
+    injury_report = get_injury_report()
+    print(injury_report.to_string(index=False) if len(injury_report) else "No injuries listed")
+
+def print_statmuse(args):
+    fullname, season_averages = get_statmuse_season_averages(args.player, args.as_of)
+    print(f"{fullname} season averages: {season_averages}")
+    if args.opponent:
+        historical_stats = get_statmuse_player_vs_team(args.player, args.opponent, CATEGORIES, args.as_of)
+        print(f"vs {args.opponent} over {historical_stats['games_played']} games: {historical_stats['averages']}")
+
+def run_publish(args):
+    create_player_rankings(registry=PlayerRegistry(args.player_registry), batch_size=args.batch_size,
+                           write_mode=args.write_mode, report_path=args.report, export_path=args.export_parquet,
+                           dry_run=args.command == 'dry-run', allow_empty=args.allow_empty)
+
+def run_backfill(args):
+    backfill(args.start, args.end, processes=args.processes, batch_size=args.batch_size, report_path=args.report, export_path=args.export_parquet)
+
+def run_watch(args):
+    watch(interval=args.interval, polls=args.polls, registry=PlayerRegistry(args.player_registry),
+          batch_size=args.batch_size, report_path=args.report)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Scrape NBA slates and publish them to MongoDB.")
+    parser.add_argument('--offline', action='store_true', help="serve every page from the HTTP cache, never the network")
+    parser.add_argument('--no-cache', action='store_true', help="skip the HTTP cache entirely")
+    parser.add_argument('--cache-path', help=f"HTTP cache file (default: {CACHE_PATH})")
+    parser.add_argument('--report', default=RUN_REPORT_PATH, help="where to write the JSON run report")
+    parser.add_argument('--profile', help="write cProfile stats for the whole run to this file")
+    parser.add_argument('--trace-memory', action='store_true', help="record peak traced memory for the run")
+    # Without a command the daily job publishes, as it always has
+    parser.set_defaults(handler=run_publish, player_registry=None, batch_size=MONGO_BATCH_SIZE,
+                        write_mode=DEFAULT_WRITE_MODE, export_parquet=None, allow_empty=False)
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    run_options = argparse.ArgumentParser(add_help=False)
+    run_options.add_argument('--player-registry', help="JSON file to reuse season averages across runs on the same day")
+    batch_options = argparse.ArgumentParser(add_help=False)
+    batch_options.add_argument('--batch-size', type=int, default=MONGO_BATCH_SIZE, help="documents per MongoDB write batch")
+    export_options = argparse.ArgumentParser(add_help=False)
+    export_options.add_argument('--export-parquet', metavar='PATH',
+                                help="also write every game log as one row per game to a Parquet file (needs pyarrow)")
+
+    command = commands.add_parser('lineups', help="print the starting lineups")
+    command.add_argument('--date', help="slate date (YYYY-MM-DD), today by default")
+    command.set_defaults(handler=print_lineups)
+
+    command = commands.add_parser('injuries', help="print the ESPN injury report")
+    command.set_defaults(handler=print_injuries)
+
+    command = commands.add_parser('statmuse', help="look up one player's statmuse numbers")
+    command.add_argument('player')
+    command.add_argument('--opponent', help="also show the player's history against this team")
+    command.add_argument('--as-of', help="only count games before this date (YYYY-MM-DD)")
+    command.set_defaults(handler=print_statmuse)
+
+    for name, help_text in [('publish', "scrape today's slate and publish it to MongoDB (the default)"),
+                            ('dry-run', "scrape today's slate and build every document without touching MongoDB")]:
+        command = commands.add_parser(name, parents=[run_options, batch_options, export_options], help=help_text)
+        command.add_argument('--write-mode', choices=WRITE_MODES, default=DEFAULT_WRITE_MODE,
+                             help="swap in freshly built collections, or upsert only changed documents")
+        command.add_argument('--allow-empty', action='store_true',
+                             help="publish even when the run produced no or far fewer documents than expected")
+        command.set_defaults(handler=run_publish)
+
+    command = commands.add_parser('backfill', parents=[batch_options, export_options],
+                                  help="backfill a date range into the history collections")
+    command.add_argument('start', help="first date (YYYY-MM-DD)")
+    command.add_argument('end', help="last date (YYYY-MM-DD), inclusive")
+    command.add_argument('--processes', type=int, default=BACKFILL_PROCESSES, help="worker processes")
+    command.set_defaults(handler=run_backfill)
+
+    command = commands.add_parser('watch', parents=[run_options, batch_options],
+                                  help="poll lineups and injuries and republish only the players that changed")
+    command.add_argument('--interval', type=int, default=WATCH_INTERVAL, help="seconds between polls")
+    command.add_argument('--polls', type=int, help="stop after this many polls (default: run until interrupted)")
+    command.set_defaults(handler=run_watch)
+
+    return parser
 
 if __name__ == '__main__':
-    create_player_rankings()
+    args = build_parser().parse_args()
+
+    configure_cache(enabled=not args.no_cache, offline=args.offline, path=args.cache_path)
+    if args.trace_memory:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+
+    args.handler(args)
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        print(f"Profile written to {args.profile}")